@@ -1,119 +1,27 @@
+import time
+import logging
 import streamlit as st
-import io
 import re
-import pdfplumber
-import sqlite3
-import pandas as pd
-from fpdf import FPDF
 from datetime import datetime, timedelta
 
+import diagnostics
+
+# Início da execução do script (medição do tempo de carregamento da página)
+_script_started = time.perf_counter()
+
+# Orçamento de tempo para a primeira renderização de uma sessão
+STARTUP_BUDGET_SECONDS = 1.0
+
+logger = logging.getLogger(__name__)
+
+# Diagnóstico de desempenho desta execução (PMHRS_DIAGNOSTICS=1 ou ?diagnostics=1 na URL)
+if diagnostics.enabled_by_environment() or st.query_params.get("diagnostics") == "1":
+    st.session_state.script_runs = st.session_state.get("script_runs", 0) + 1
+    diagnostics.start_run(st.session_state.get("page", "homepage"), session_reruns=st.session_state.script_runs)
+
+# Bibliotecas pesadas (pandas, pdfplumber, fpdf) são importadas apenas nas
+# páginas que as usam; a página inicial só precisa do Streamlit.
 
-# Conexão com o banco de dados
-def get_connection():
-    conn = sqlite3.connect("fechamento_semanal.db")
-    return conn
-
-
-# Função para criar tabelas (executa uma vez)
-def create_tables():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS fechamento_semanal (
-        Id INTEGER PRIMARY KEY AUTOINCREMENT,
-        Installer TEXT NOT NULL,
-        Customer_name TEXT NOT NULL,
-        Job_number TEXT NOT NULL,
-        Labor_REAL NOT NULL,
-        Expenses REAL NOT NULL,
-        Pay_date TEXT NOT NULL,
-        Job_date TEXT NOT NULL,
-        Prices_after_percent REAL NOT NULL,
-        Discount REAL NOT NULL,
-        Extras_details TEXT,
-        Back_charge REAL NOT NULL
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS extras (
-        Id INTEGER PRIMARY KEY AUTOINCREMENT,
-        Installer TEXT NOT NULL,
-        Extra_name TEXT NOT NULL,
-        Extra_value REAL NOT NULL,
-        Extra_date TEXT NOT NULL
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS back_charges (
-        Id INTEGER PRIMARY KEY AUTOINCREMENT,
-        Installer TEXT NOT NULL,
-        Back_charge value REAL NOT NULL,
-        reason TEXT
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS summary (
-        Id INTEGER PRIMARY KEY AUTOINCREMENT,
-        Installer TEXT NOT NULL,
-        Total_labor REAL NOT NULL,
-        Total_expenses REAL NOT NULL,
-        Total_extras REAL NOT NULL,
-        Total_back_charges REAL NOT NULL,
-        Total_price REAL NOT NULL,
-        Report date TEXT NOT NULL
-    )
-    """)
-    conn.commit()
-    conn.close()
-
-
-# Função para inserir dados no banco
-def insert_data(table, data):
-    conn = get_connection()
-    cursor = conn.cursor()
-    placeholders = ', '.join(['?'] * len(data))
-    cursor.execute(f"INSERT INTO {table} VALUES (NULL, {placeholders})", tuple(data))
-    conn.commit()
-    conn.close()
-
-
-# Função para consultar dados do banco
-def query_data(query, params=()):
-    conn = get_connection()
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    return df
-
-# Função para salvar os dados no banco
-def save_to_database(data):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Converta colunas de datas para strings compatíveis com SQLite
-    if "pay_date" in data.columns:
-        data["pay_date"] = data["pay_date"].dt.strftime('%Y-%m-%d')
-    if "job_date" in data.columns:
-        data["job_date"] = data["job_date"].dt.strftime('%Y-%m-%d')
-
-    for _, row in data.iterrows():
-        cursor.execute("""
-        INSERT INTO fechamento_semanal (
-            installer, customer_name, job_number, labor, expenses, pay_date, 
-            job_date, prices_after_percent, discount, extras_details, back_charge
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            row["installer"], row["customer name"], row["job number"], row["labor"], row["expenses"],
-            row["pay_date"], row["job_date"], row["prices_after_percent"], row["discount"],
-            row.get("extras_details", ""), row["back_charge"]
-        ))
-    conn.commit()
-    conn.close()
-# Inicializa o banco de dados
-create_tables()
 
 # Função para adicionar estilo personalizado
 def add_custom_style():
@@ -149,113 +57,6 @@ def add_custom_style():
     )
 
 
-# Classe PDF para relatórios
-class CustomStyledPDF(FPDF):
-    def __init__(self, orientation="L", unit="mm", format="A4"):
-        super().__init__(orientation, unit="mm", format="A4")
-        self.set_auto_page_break(auto=True, margin=15)
-
-    def header(self):
-        self.set_fill_color(200, 220, 255)
-        self.set_font("Arial", "B", 14)
-        self.cell(0, 10, "PM Home Remodeling System", ln=True, align="C", fill=True)
-        self.set_font("Arial", "B", 12)
-        self.cell(0, 10, f"Week - {self.period}", ln=True, align="C")
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Arial", "I", 8)
-        self.cell(0, 10, f"Installer: {self.team_name}", align="C")
-
-    def set_team_and_period(self, team_name, period):
-        self.team_name = team_name
-        self.period = period
-
-    def add_table(self, title, headers, rows):
-        self.set_font("Arial", "B", 10)
-        self.cell(0, 10, title, ln=True, align="L")
-        self.ln(5)
-
-        self.set_fill_color(180, 180, 180)
-        self.set_text_color(255, 255, 255)
-        self.set_font("Arial", "B", 8)
-        col_widths = [25, 50, 30, 30, 40, 40, 30]
-        for header, width in zip(headers, col_widths):
-            self.cell(width, 8, header, border=1, align="C", fill=True)
-        self.ln()
-
-        self.set_font("Arial", "", 8)
-        self.set_text_color(0, 0, 0)
-        for row in rows:
-            for cell, width in zip(row, col_widths):
-                self.cell(width, 8, str(cell), border=1, align="C")
-            self.ln()
-
-
-# Função para gerar o PDF detalhado
-def generate_detailed_pdf(data, summary, team_name, period, extras, back_charge):
-    pdf = CustomStyledPDF()
-    pdf.set_team_and_period(team_name, period)
-    pdf.add_page()
-
-    summary_headers = [
-        "ID", "Name", "Address", "City", "State",
-        "Phone Number", "TOTAL after %"
-    ]
-    summary_rows = [
-        [
-            row["ID"], row["Name"], row["Address"], row["City"],
-            row["State"], row["Phone Number"], f"${row['TOTAL after %']:.2f}"
-        ]
-        for row in summary
-    ]
-    pdf.add_table("Summary", summary_headers, summary_rows)
-
-    detail_headers = [
-        "Installer", "Customer Name", "Job Number", "Labor",
-        "When the job was done", "Prices after %", "Despesas"
-    ]
-    detail_rows = [
-        [
-            row["installer"], row["customer name"], row["job number"],
-            f"${row['labor']:.2f}", row["when the job was done"],
-            f"${row['prices after %']:.2f}", f"${row['despesas']:.2f}"
-        ]
-        for row in data
-    ]
-    pdf.add_table("Details", detail_headers, detail_rows)
-
-    # Exibir Extras e Back Charge
-    if extras or back_charge > 0:
-        pdf.ln(10)
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 10, "Extras e Back Charges", ln=True, align="L")
-        pdf.set_font("Arial", "", 10)
-
-        # Listar extras, se existirem
-        for extra in extras:
-            pdf.cell(
-                0,
-                10,
-                f"Extra: {extra['name']} - ${extra['value']:.2f} on {extra['date']}",
-                ln=True,
-                align="L",
-            )
-
-        # Exibir Back Charge, se aplicado
-        if back_charge > 0:
-            pdf.cell(
-                0,
-                10,
-                f"Back Charge aplicado: -${back_charge:.2f}",
-                ln=True,
-                align="L",
-            )
-
-    return pdf.output(dest="S").encode("latin1")
-
-
 # Função para a página inicial
 def homepage():
     st.title("Bem-vindo ao Sistema de Fechamento Semanal")
@@ -279,7 +80,7 @@ def homepage():
     )
 
     # Botões lado a lado usando colunas
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
 
     with col1:
         if st.button("Fechamento Semanal"):
@@ -293,8 +94,327 @@ def homepage():
         if st.button("Labor Bill"):
             st.session_state.page = "Labor Bill"
 
+    with col4:
+        if st.button("Painel de Análises"):
+            st.session_state.page = "analytics"
+
+# Pré-visualização paginada: os dados ficam no servidor e só a página visível vai para o navegador
+@st.fragment
+def paged_preview(df, key, installer_column="installer", date_column="pay date"):
+    import pandas as pd
+    from preview import PAGE_SIZES, filter_rows, page_rows
+
+    col1, col2, col3 = st.columns([3, 3, 1])
+    with col1:
+        options = []
+        if installer_column in df.columns:
+            options = sorted(df[installer_column].dropna().astype(str).unique())
+        installers = st.multiselect("Instaladores", options, key=f"{key}_installers")
+    start = end = None
+    with col2:
+        dates = pd.to_datetime(df[date_column], errors="coerce").dropna() if date_column in df.columns else None
+        if dates is not None and not dates.empty:
+            first, last = dates.min().date(), dates.max().date()
+            selected = st.date_input("Pay date", value=(first, last), min_value=first, max_value=last,
+                                     key=f"{key}_dates")
+            if len(selected) == 2:
+                start, end = selected
+    with col3:
+        page_size = st.selectbox("Linhas", PAGE_SIZES, index=1, key=f"{key}_page_size")
+
+    col1, col2, col3 = st.columns([3, 3, 1])
+    with col1:
+        sort_by = st.selectbox("Ordenar por", ["(ordem da planilha)"] + list(df.columns), key=f"{key}_sort")
+    with col2:
+        descending = st.checkbox("Decrescente", key=f"{key}_descending")
+    with col3:
+        page = st.number_input("Página", min_value=1, value=1, step=1, key=f"{key}_page")
+
+    filtered = filter_rows(df, installers, start, end, installer_column, date_column)
+    rows, total, pages, page = page_rows(
+        filtered, page, page_size, None if sort_by == "(ordem da planilha)" else sort_by, not descending
+    )
+    st.dataframe(rows)
+    first_row = (page - 1) * page_size + 1 if total else 0
+    last_row = first_row + len(rows) - 1 if total else 0
+    st.caption(f"Página {page} de {pages} · linhas {first_row}–{last_row} de {total} (de {len(df)} na planilha)")
+
+
+# Colunas mostradas na grade de edição de cada instalador
+GRID_COLUMNS = ["customer name", "job number", "when the job was done", "labor", "despesas"]
+
+
+# Função para calcular o estado atual de um instalador (com as alterações aplicadas)
+def installer_state(installer, installer_data):
+    from payouts import TEAM_DISCOUNTS, compute_payouts
+
+    edit = st.session_state.installer_edits.get(installer, {})
+    if "labor" in edit:
+        installer_data = installer_data.assign(labor=edit["labor"], despesas=edit["despesas"])
+    extras = edit.get("extras", [])
+    back_charge = edit.get("back_charge", 0.0)
+
+    with diagnostics.span("payouts.compute", installer=installer):
+        jobs, payouts = compute_payouts(installer_data, TEAM_DISCOUNTS, {installer: extras}, {installer: back_charge})
+    diagnostics.count("payouts.rows", len(jobs))
+    return jobs, payouts.loc[installer], extras, back_charge
+
+
+# Função para montar os argumentos do relatório de um instalador
+def installer_report(installer, installer_data, period):
+    from reports import build_installer_report
+
+    jobs, payout, extras, back_charge = installer_state(installer, installer_data)
+    return build_installer_report(installer, jobs, payout["final_total"], period, extras, back_charge)
+
+
+# Aba de um instalador: grade, extras e back charge em um formulário
+@st.fragment
+def installer_editor(installer, installer_data, period):
+    import pandas as pd
+    from reports import (
+        build_installer_report, build_report_payload, encode_report_payload, render_report, report_file_name
+    )
+
+    st.write(f"#### Data for {installer}")
+
+    # Nada é recalculado enquanto o usuário edita; só ao aplicar o formulário
+    with st.form(key=f"{installer}_form"):
+        edited_grid = st.data_editor(
+            installer_data[GRID_COLUMNS],
+            disabled=["customer name", "job number", "when the job was done"],
+            column_config={
+                "labor": st.column_config.NumberColumn("Labor", min_value=0.0, step=0.01, format="$%.2f"),
+                "despesas": st.column_config.NumberColumn("Despesas", min_value=0.0, step=0.01, format="$%.2f"),
+            },
+            key=f"{installer}_grid",
+        )
+
+        st.write("**Extra Services**")
+        extras_grid = st.data_editor(
+            pd.DataFrame({"name": pd.Series(dtype=object), "value": pd.Series(dtype=float),
+                          "date": pd.Series(dtype=object)}),
+            num_rows="dynamic",
+            column_config={
+                "name": st.column_config.TextColumn("Extra Service Name"),
+                "value": st.column_config.NumberColumn("Value", min_value=0.0, step=0.01, format="$%.2f"),
+                "date": st.column_config.DateColumn("Date", default=datetime.today().date()),
+            },
+            key=f"{installer}_extras",
+        )
+
+        # Adicionar Back Charge
+        back_charge = st.number_input(
+            f"Back Charge para {installer} (subtração do total semanal):",
+            min_value=0.0,
+            step=0.01,
+            key=f"{installer}_back_charge",
+        )
+        submitted = st.form_submit_button("Aplicar alterações")
+
+    if submitted:
+        extras = [
+            {"name": extra["name"] or "", "value": float(extra["value"]), "date": extra["date"]}
+            for extra in extras_grid.dropna(subset=["value"]).to_dict(orient="records")
+        ]
+        st.session_state.installer_edits[installer] = {
+            "labor": edited_grid["labor"],
+            "despesas": edited_grid["despesas"],
+            "extras": extras,
+            "back_charge": back_charge,
+        }
+        st.session_state.pop("reports_bundle_job", None)
+
+    jobs, payout, extras, back_charge = installer_state(installer, installer_data)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Labor", f"${payout['total_labor']:,.2f}")
+    col2.metric("Despesas", f"${payout['total_despesas']:,.2f}")
+    col3.metric("Prices after %", f"${payout['total_prices_after_percent']:,.2f}")
+    col4.metric("Total", f"${payout['final_total']:,.2f}")
+
+    # PDF só é gerado sob demanda; a assinatura (dados embutidos) detecta alterações
+    report = build_installer_report(installer, jobs, payout["final_total"], period, extras, back_charge)
+    file_name = report_file_name(installer, period)
+    signature = encode_report_payload(build_report_payload(**report))
+    rendered = st.session_state.setdefault("rendered_reports", {})
+
+    cached = rendered.get(file_name)
+    if cached is None or cached[0] != signature:
+        if st.button(f"Generate Report for {installer}", key=f"{installer}_generate_report"):
+            with diagnostics.span("pdf.render", installer=installer):
+                rendered[file_name] = (signature, render_report(report))
+            diagnostics.count("pdf.bytes_rendered", len(rendered[file_name][1]))
+            cached = rendered[file_name]
+
+    if cached is not None and cached[0] == signature:
+        # Adicionar botão para baixar o relatório
+        st.download_button(
+            label=f"Download Report for {installer}",
+            data=cached[1],
+            file_name=file_name,
+            mime="application/pdf",
+            key=f"{installer}_download_report",
+        )
+
+
+# Seção do ZIP com todos os relatórios (lê as alterações aplicadas no momento do clique)
+@st.fragment
+def reports_bundle_section(week_data, period):
+    from jobs import FINISHED_STATUSES, get_job, job_result, reports_zip_task, submit_job
+    from reports import report_file_name
+
+    st.write("### Relatórios")
+    if st.button("Gerar todos os relatórios (ZIP)", key="generate_reports_zip"):
+        reports = {
+            report_file_name(installer, period): installer_report(installer, installer_data, period)
+            for installer, installer_data in week_data.items()
+        }
+        # Renderização em segundo plano: continua mesmo se o usuário sair da página
+        st.session_state.reports_bundle_job = submit_job(
+            "reports_zip", f"Relatórios {period} (ZIP)", reports_zip_task, reports, f"Reports_{period}.zip"
+        )
+
+    job_id = st.session_state.get("reports_bundle_job")
+    job = get_job(job_id) if job_id else None
+    if job is not None and job["status"] not in FINISHED_STATUSES:
+        job_progress(job_id)
+    elif job is not None and job["status"] == "done":
+        bundle = job_result(job)
+        if bundle is not None:
+            st.download_button(
+                label="Baixar todos os relatórios (ZIP)",
+                data=bundle,
+                file_name=job["result_name"],
+                mime="application/zip",
+                key="download_reports_zip",
+            )
+            st.caption(f"ZIP gerado em {job['updated_at']}, com as alterações aplicadas até então.")
+    elif job is not None:
+        st.error(f"Não foi possível gerar o ZIP: {job['error']}")
+
+    recent_jobs_panel(["reports_zip"], key="reports_zip_jobs")
+
+
+# Andamento de um trabalho em segundo plano (atualiza sozinho a cada segundo)
+@st.fragment(run_every=1.0)
+def job_progress(job_id):
+    from jobs import FINISHED_STATUSES, get_job
+
+    job = get_job(job_id)
+    if job is None or job["status"] in FINISHED_STATUSES:
+        # Terminou: a página inteira roda de novo para mostrar o resultado
+        st.rerun()
+    st.progress(job["progress"], text=f"{job['label']}: {job['message'] or 'na fila'}")
+    st.caption("Roda em segundo plano: você pode sair desta página e buscar o resultado depois.")
+
+
+# Lista dos trabalhos recentes: qualquer sessão pode baixar os resultados prontos
+def recent_jobs_panel(kinds, key):
+    from jobs import job_result, list_jobs
+
+    jobs = list_jobs(kinds, limit=10)
+    if not jobs:
+        return
+
+    with st.expander("Trabalhos recentes"):
+        st.dataframe([
+            {"criado em": job["created_at"], "trabalho": job["label"], "status": job["status"],
+             "andamento": f"{job['progress']:.0%}", "erro": job["error"] or ""}
+            for job in jobs
+        ], hide_index=True)
+
+        ready = {job["id"]: job for job in jobs if job["status"] == "done" and job["result_digest"]}
+        if not ready:
+            return
+        picked = st.selectbox(
+            "Resultado", list(ready), key=f"{key}_picked",
+            format_func=lambda job_id: f"{ready[job_id]['created_at']} · {ready[job_id]['label']}",
+        )
+        data = job_result(ready[picked])
+        if data is None:
+            st.warning("Este resultado já expirou.")
+        else:
+            name = ready[picked]["result_name"]
+            st.download_button(
+                label=f"Baixar {name}",
+                data=data,
+                file_name=name,
+                mime="application/zip" if name.endswith(".zip") else "application/pdf",
+                key=f"{key}_download",
+            )
+
+
+# Seção de fechamento em lote: todas as semanas de um intervalo de pay dates
+def batch_closing_section(workbook_df, scope):
+    import pandas as pd
+    from jobs import FINISHED_STATUSES, batch_closing_task, get_job, job_result, submit_job
+
+    pay_dates = pd.to_datetime(workbook_df["pay date"], errors="coerce").dropna()
+    if pay_dates.empty:
+        return
+
+    with st.expander("Fechamento em lote (várias semanas)"):
+        first, last = pay_dates.min().date(), pay_dates.max().date()
+        selected = st.date_input(
+            "Intervalo de pay dates", value=(first, last), min_value=first, max_value=last, key="batch_pay_dates"
+        )
+        save = st.checkbox("Salvar no banco de dados", value=False, key="batch_save")
+
+        if st.button("Fechar semanas do intervalo", key="batch_close"):
+            if len(selected) != 2:
+                st.warning("Escolha a data inicial e a final do intervalo.")
+                return
+            # Os PDFs são gerados em segundo plano e entregues em um único ZIP
+            st.session_state.batch_job = (scope, submit_job(
+                "batch_closing", f"Fechamento de {selected[0]} a {selected[1]}",
+                batch_closing_task, workbook_df, selected[0], selected[1], save,
+            ))
+
+        # O trabalho guardado vale só para a planilha que o gerou
+        job_scope, job_id = st.session_state.get("batch_job", (None, None))
+        job = get_job(job_id) if job_scope == scope else None
+        if job is not None and job["status"] not in FINISHED_STATUSES:
+            job_progress(job_id)
+        elif job is not None and job["status"] == "done":
+            result = job["result"]
+            if not result["weeks"]:
+                st.warning(f"Nenhum pagamento entre {result['start']} e {result['end']}.")
+                return
+            st.table(pd.DataFrame([
+                {"pay date": week["pay_date"], "jobs": week["jobs"], "instaladores": len(week["installers"]),
+                 "labor": week["totals"]["labor"], "TOTAL after %": week["totals"]["total_after"],
+                 "lucro": week["totals"]["lucro"]}
+                for week in result["weeks"]
+            ]))
+            if "sync" in result:
+                sync = result["sync"]
+                st.success(f"Banco de dados sincronizado: {sync['inserted']} nova(s), {sync['updated']} alterada(s), "
+                           f"{sync['deleted']} apagada(s), {sync['unchanged']} sem mudança.")
+            bundle = job_result(job)
+            if bundle is not None:
+                st.download_button(
+                    label=f"Baixar relatórios de {result['start']} a {result['end']} (ZIP)",
+                    data=bundle,
+                    file_name=job["result_name"],
+                    mime="application/zip",
+                    key="batch_download",
+                )
+        elif job is not None:
+            st.error(f"Não foi possível fechar as semanas: {job['error']}")
+
+    recent_jobs_panel(["batch_closing"], key="batch_closing_jobs")
+
+
 # Função para o Fechamento Semanal
 def fechamento_semanal():
+    import pandas as pd
+    from database import ensure_database, sync_week, week_records
+    from jobs import FINISHED_STATUSES, get_job, save_week_task, submit_job
+    from payouts import normalize_installers, sort_installers
+    from pipeline import week_rows
+    from workbook import read_payroll_workbook
+
+    ensure_database()
 
 
     st.title("Fechamento Semanal")
@@ -305,34 +425,20 @@ def fechamento_semanal():
                                      key="fechamento_semanal_file")
 
     if uploaded_file:
-        df = pd.read_excel(uploaded_file, header=1)
+        # Planilha lida e normalizada uma vez por conteúdo (cache entre reruns)
+        workbook_bytes = uploaded_file.getvalue()
+        with diagnostics.span("workbook.read"):
+            workbook_df = read_payroll_workbook(workbook_bytes)
+        diagnostics.count("workbook.bytes", len(workbook_bytes))
+        diagnostics.count("workbook.rows", len(workbook_df))
+        df = workbook_df.rename(columns={"date": "when the job was done"})
 
         st.title("Weekly Payment Report Generator")
 
-        team_discounts = {
-            "PM2": 0.30,
-            "PM3": 0.20,
-            "PM4": 0.20,
-            "PM5": 0.20,
-            "PM6": 0.30,
-            "PM7": 0.20,
-            "PM8": 0.20,
-        }
-
         if uploaded_file:
-            df.columns = [col.strip().lower() for col in df.columns]
-
-            if "unnamed: 8" in df.columns:
-                df.rename(columns={"unnamed: 8": "customer name"}, inplace=True)
-            if "job #" in df.columns:
-                df.rename(columns={"job #": "job number"}, inplace=True)
-            if "date" in df.columns:
-                df.rename(columns={"date": "when the job was done"}, inplace=True)
-
-            df = df.dropna(subset=["customer name"])
-
             st.write("### Uploaded Data Preview:")
-            st.dataframe(df)
+            with diagnostics.span("widgets.preview"):
+                paged_preview(df, key="upload_preview")
 
             required_columns = ["installer", "pay date", "labor", "customer name", "job number",
                                 "when the job was done"]
@@ -341,6 +447,9 @@ def fechamento_semanal():
                 st.error(f"Missing required columns: {', '.join(missing_columns)}")
                 return
 
+            # Atraso de várias semanas (ex.: feriado): fechar um intervalo de uma vez
+            batch_closing_section(workbook_df, getattr(uploaded_file, "file_id", uploaded_file.name))
+
             next_friday = (datetime.today() + timedelta((4 - datetime.today().weekday()) % 7)).strftime('%Y-%m-%d')
             df["pay date"] = pd.to_datetime(df["pay date"], errors="coerce")
             filtered_data = df[df["pay date"] == next_friday]
@@ -351,147 +460,40 @@ def fechamento_semanal():
 
             st.write(f"### Edit Payments and Expenses for Each Installer (Payments for {next_friday}):")
 
-            filtered_data["installer"] = filtered_data["installer"].astype(str).str.extract(r'(\d+)', expand=False)
-            filtered_data["installer"] = filtered_data["installer"].fillna("0")
-            filtered_data["installer"] = "PM" + filtered_data["installer"]
-
-            installers = sorted(filtered_data["installer"].unique(), key=lambda x: int(x[2:]))
-            tabs = st.tabs(installers)
-
-            edited_data = []
-            extras_data = {}
-            back_charges = {}
-
-            for tab, installer in zip(tabs, installers):
-                with tab:
-                    installer_data = filtered_data[filtered_data["installer"] == installer].copy()
-                    st.write(f"#### Data for {installer}")
-
-                    if "prices after %" not in installer_data.columns:
-                        installer_data["prices after %"] = 0.0
-
-                    for idx, row in installer_data.iterrows():
-                        labor = max(row["labor"], 0.0)
-                        despesas = max(row.get("despesas", 0.0), 0.0)
-
-                        labor = st.number_input(
-                            f"Labor for {row['customer name']}",
-                            min_value=0.0,
-                            value=labor,
-                            step=0.01,
-                            key=f"{installer}_{idx}_labor"
-                        )
-                        despesas = st.number_input(
-                            f"Expenses for {row['customer name']}",
-                            min_value=0.0,
-                            value=despesas,
-                            step=0.01,
-                            key=f"{installer}_{idx}_despesas"
-                        )
-
-                        installer_data.at[idx, "labor"] = labor
-                        installer_data.at[idx, "despesas"] = despesas
-
-                        discount = team_discounts.get(installer, 0.0)
-                        prices_after_discount = (labor - despesas) * (1 - discount)
-                        prices_after_percent = prices_after_discount + despesas
-
-                        installer_data.at[idx, "prices after %"] = prices_after_percent
-
-                    st.dataframe(installer_data)
-
-                    extras = []
-                    num_extras = st.number_input(
-                        f"How many extra services for {installer}?",
-                        min_value=0,
-                        value=0,
-                        step=1,
-                        key=f"{installer}_num_extras",
-                    )
+            filtered_data = filtered_data.assign(installer=normalize_installers(filtered_data["installer"]))
+            if "despesas" not in filtered_data.columns:
+                filtered_data["despesas"] = 0.0
 
-                    for i in range(num_extras):
-                        st.write(f"**Extra Service #{i + 1}**")
-                        extra_name = st.text_input(f"Extra Service Name #{i + 1} ({installer})",
-                                                   key=f"{installer}_{i}_name")
-                        extra_value = st.number_input(
-                            f"Extra Service Value #{i + 1} ({installer})",
-                            min_value=0.0,
-                            step=0.01,
-                            key=f"{installer}_{i}_value",
-                        )
-                        extra_date = st.date_input(
-                            f"Date of Extra Service #{i + 1} ({installer})", key=f"{installer}_{i}_date"
-                        )
-                        extras.append(
-                            {
-                                "name": extra_name,
-                                "value": extra_value,
-                                "date": extra_date,
-                            }
-                        )
-                    extras_data[installer] = extras
-
-                    # Adicionar Back Charge
-                    back_charge = st.number_input(
-                        f"Back Charge para {installer} (subtração do total semanal):",
-                        min_value=0.0,
-                        step=0.01,
-                        key=f"{installer}_back_charge",
-                    )
-                    back_charges[installer] = back_charge
-
-                    edited_data.append(installer_data)
-
-            # Gerar relatórios para cada instalador
-            for installer_data in edited_data:
-                installer = installer_data["installer"].iloc[0]
-                total_prices_after_percent = installer_data["prices after %"].sum()
-
-                discount = team_discounts.get(installer, 0.0)
-                extras = extras_data.get(installer, [])
-                extra_total = sum(extra["value"] for extra in extras)
-                back_charge = back_charges.get(installer, 0.0)
-                final_total = total_prices_after_percent + extra_total - back_charge
-
-                summary = [{
-                    "ID": installer,
-                    "Name": f"Installer {installer}",
-                    "Address": "Sample Address",
-                    "City": "Sample City",
-                    "State": "ST",
-                    "Phone Number": "(000) 000-0000",
-                    "TOTAL after %": final_total
-                }]
-                pdf_content = generate_detailed_pdf(
-                    installer_data.to_dict(orient="records"),
-                    summary,
-                    f"Installer {installer}",
-                    next_friday,
-                    extras,
-                    back_charge
-                )
+            installers = sort_installers(filtered_data["installer"].unique())
+            grouped = filtered_data.groupby("installer", sort=False)
+            week_data = {installer: grouped.get_group(installer) for installer in installers}
 
-                # Adicionar botão para baixar o relatório
-                st.download_button(
-                    label=f"Download Report for {installer}",
-                    data=pdf_content,
-                    file_name=f"{installer}_Report_{next_friday}.pdf",
-                    mime="application/pdf"
-                )
+            # Alterações aplicadas nos formulários valem para esta planilha e esta semana
+            edits_scope = (getattr(uploaded_file, "file_id", uploaded_file.name), next_friday)
+            if st.session_state.get("installer_edits_scope") != edits_scope:
+                st.session_state.installer_edits_scope = edits_scope
+                st.session_state.installer_edits = {}
+                st.session_state.rendered_reports = {}
+                st.session_state.pop("reports_bundle_job", None)
+
+            # Cada aba é um fragmento: aplicar alterações reexecuta só aquele instalador
+            with diagnostics.span("widgets.installer_tabs", installers=len(installers)):
+                tabs = st.tabs(installers)
+                for tab, installer in zip(tabs, installers):
+                    with tab:
+                        installer_editor(installer, week_data[installer], next_friday)
+
+            reports_bundle_section(week_data, next_friday)
 
     if uploaded_file:
-        df = pd.read_excel(uploaded_file, header=1)
-        df.columns = [col.strip().lower() for col in df.columns]
+        df = read_payroll_workbook(uploaded_file.getvalue())
 
         # Renomear colunas conforme necessário
-        df.rename(columns={
-            "unnamed: 8": "customer name",
-            "job #": "job number",
+        df = df.rename(columns={
             "date": "job_date",
-            "Pay Date": "pay_date",
             "pay date": "pay_date",
-            "Data de Pagamento": "pay_date"
-        }, inplace=True)
+            "data de pagamento": "pay_date"
+        })
 
         # Verificar se a coluna 'pay_date' está presente
         if "pay_date" not in df.columns:
@@ -505,146 +507,124 @@ def fechamento_semanal():
             st.stop()
 
         # Filtrar dados editáveis
-        df = df.dropna(subset=["customer name"])
         df["pay_date"] = pd.to_datetime(df["pay_date"], errors="coerce")
 
         # Determinar a última semana no campo "Pay Date"
         last_week_date = df["pay_date"].max()
         filtered_df = df[df["pay_date"] == last_week_date]
 
-        # Adicionar edição dos valores
-        edited_data = []
-        for idx, row in filtered_df.iterrows():
-            col1, col2 = st.columns(2)
-            with col1:
-                labor = st.number_input(f"Labor para {row['customer name']}", value=row["labor"], key=f"labor_{idx}")
-            with col2:
-                expenses = st.number_input(f"Despesas para {row['customer name']}", value=row.get("expenses", 0.0),
-                                            key=f"expenses_{idx}")
-
-            row["labor"] = labor
-            row["expenses"] = expenses
-            row["prices_after_percent"] = labor - expenses  # Exemplo de cálculo
-            edited_data.append(row)
-
-        # Converta os dados editados para um DataFrame
-        edited_df = pd.DataFrame(edited_data)
-
-        # Verifica se a coluna 'discount' está presente; se não, adiciona com valor padrão 0.0
-        if "discount" not in edited_df.columns:
-            edited_df["discount"] = 0.0
-
-        if "back_charge" not in edited_df.columns:
-            edited_df["back_charge"] = 0.0
+        # Adicionar edição dos valores (só as alteradas entram como edição); as
+        # despesas mostradas são as mesmas que prepare_weeks() grava
+        expense_column = "despesas" if "despesas" in df.columns else "expenses"
+        row_edits = {}
+        with diagnostics.span("widgets.week_editor", rows=len(filtered_df)):
+            for idx, row in filtered_df.iterrows():
+                col1, col2 = st.columns(2)
+                with col1:
+                    labor = st.number_input(f"Labor para {row['customer name']}", value=row["labor"], key=f"labor_{idx}")
+                with col2:
+                    expenses = st.number_input(f"Despesas para {row['customer name']}", value=row.get(expense_column, 0.0),
+                                                key=f"expenses_{idx}")
+
+                if labor != row["labor"]:
+                    row_edits.setdefault(idx, {})["labor"] = labor
+                if expenses != row.get(expense_column, 0.0):
+                    row_edits.setdefault(idx, {})["despesas"] = expenses
+
+        # Linhas a gravar pelo mesmo caminho do CLI: instaladores normalizados,
+        # descontos das equipes e, se for a semana dos formulários, as
+        # alterações aplicadas nas abas. Os formulários começam sem extras e
+        # sem back charge, então só o que foi preenchido vai para o banco: os
+        # demais instaladores mantêm o que já estava gravado
+        period = last_week_date.strftime('%Y-%m-%d')
+        edit_frames = []
+        form_edits = {}
+        if st.session_state.get("installer_edits_scope") == (getattr(uploaded_file, "file_id", uploaded_file.name), period):
+            form_edits = st.session_state.get("installer_edits", {})
+            edit_frames += [
+                pd.DataFrame({"labor": edit["labor"], "despesas": edit["despesas"]})
+                for edit in form_edits.values() if "labor" in edit
+            ]
+        if row_edits:
+            edit_frames.append(pd.DataFrame.from_dict(row_edits, orient="index"))
+        try:
+            edited_df, extras, back_charges = week_rows(
+                workbook_df.rename(columns={"data de pagamento": "pay date"})
+                if "pay date" not in workbook_df.columns else workbook_df,
+                period,
+                pd.concat(edit_frames) if edit_frames else None,
+                {installer: edit["extras"] for installer, edit in form_edits.items() if edit.get("extras")},
+                {installer: edit["back_charge"] for installer, edit in form_edits.items() if edit.get("back_charge")},
+            )
+        except ValueError as e:
+            st.error(f"Dados inválidos: {e}")
+            st.stop()
 
         st.write("### Dados Editados da Última Semana:")
-        st.dataframe(edited_df)
-
-        # Salvar dados no banco de dados
-        if st.button("Salvar no Banco de Dados"):
-            save_to_database(edited_df)
-            st.success(f"Dados da última semana ({last_week_date.strftime('%Y-%m-%d')}) salvos no banco de dados com sucesso!")
+        paged_preview(edited_df, key="edited_preview", date_column="pay_date")
+
+        # Salvar dados no banco de dados (sincronização: só o que mudou desde a última gravação)
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Validar Dados"):
+                try:
+                    diff = sync_week(edited_df, dry_run=True, extras=extras, back_charges=back_charges)
+                    st.success(f"{diff['inserted']} nova(s), {diff['updated']} alterada(s), "
+                               f"{diff['deleted']} a apagar, {diff['unchanged']} sem mudança, "
+                               f"{diff['adjusted']} instalador(es) com extras/back charges alterados.")
+                    if not diff["changes"].empty:
+                        st.write("### Alterações que serão gravadas:")
+                        st.dataframe(diff["changes"], hide_index=True)
+                except ValueError as e:
+                    st.error(f"Dados inválidos: {e}")
+        with col2:
+            if st.button("Salvar no Banco de Dados"):
+                try:
+                    # Validação na hora; a gravação e o arquivo Parquet rodam em segundo plano
+                    week_records(edited_df)
+                    st.session_state.save_week_job = submit_job(
+                        "save_week", f"Gravação da semana {period}",
+                        save_week_task, edited_df, extras, back_charges,
+                    )
+                except ValueError as e:
+                    st.error(f"Dados inválidos, nada foi salvo: {e}")
+
+        job_id = st.session_state.get("save_week_job")
+        job = get_job(job_id) if job_id else None
+        if job is not None and job["status"] not in FINISHED_STATUSES:
+            job_progress(job_id)
+        elif job is not None and job["status"] == "done":
+            diff = job["result"]
+            st.success(f"{job['label']} concluída ({job['updated_at']}): {diff['inserted']} nova(s), "
+                       f"{diff['updated']} alterada(s), {diff['deleted']} apagada(s), {diff['unchanged']} sem mudança; "
+                       f"{diff.get('adjusted', 0)} instalador(es) com extras/back charges alterados.")
+        elif job is not None:
+            st.error(f"Não foi possível salvar: {job['error']}")
 
     if st.button("Voltar para a Página Inicial"):
         st.session_state.page = "homepage"
 
 
 # Função para o Relatório Semanal Geral
-def extract_table_with_column(pdf_data, column_name):
-    """
-    Extrai a tabela que contém uma coluna específica do PDF.
-    """
-    try:
-        pdf_stream = io.BytesIO(pdf_data)
-        with pdfplumber.open(pdf_stream) as pdf:
-            for page in pdf.pages:
-                tables = page.extract_tables()
-                if tables:
-                    for table in tables:
-                        # Verificar se a tabela contém a coluna desejada
-                        if column_name in table[0]:  # Verifica se o cabeçalho contém a coluna
-                            df = pd.DataFrame(table[1:], columns=table[0])
-                            return df
-        return None
-    except Exception as e:
-        st.error(f"Erro ao tentar extrair a tabela com a coluna '{column_name}': {e}")
-        return None
-
-
-def calculate_totals(labor_df, total_after_df, is_pm0=False):
-    """
-    Soma os valores das colunas 'Labor' e 'TOTAL after %' e calcula o lucro.
-    Se o arquivo for 'PM0', o lucro é igual ao TOTAL after %.
-    """
-    try:
-        # Limpar e converter colunas para números
-        labor_df["Labor"] = labor_df["Labor"].str.replace("$", "").str.replace(",", "").astype(float)
-        total_after_df["TOTAL after %"] = total_after_df["TOTAL after %"].str.replace("$", "").str.replace(",", "").astype(float)
-
-        # Somar os valores das colunas
-        total_labor = labor_df["Labor"].sum()
-        total_after = total_after_df["TOTAL after %"].sum()
-
-        # Calcular o lucro
-        lucro = total_after if is_pm0 else total_labor - total_after
-
-        return total_labor, total_after, lucro
-    except Exception as e:
-        st.error(f"Erro ao calcular os totais: {e}")
-        return 0, 0, 0
-
-
-class PDFReport(FPDF):
-    def header(self):
-        self.set_font("Arial", "B", 12)
-        title = f"Relatório da Semana - {datetime.now().strftime('%d/%m/%Y')}"
-        self.cell(0, 10, title, align="C", ln=True)
-        self.ln(10)
-
-    def add_table(self, headers, rows):
-        """
-        Adiciona uma tabela ao PDF.
-        """
-        self.set_font("Arial", "B", 10)
-        col_widths = [40, 40, 40, 40]  # Ajuste os tamanhos das colunas conforme necessário
-        for header, width in zip(headers, col_widths):
-            self.cell(width, 10, header, border=1, align="C")
-        self.ln()
-
-        self.set_font("Arial", "", 10)
-        for row in rows:
-            for value, width in zip(row, col_widths):
-                self.cell(width, 10, str(value), border=1, align="C")
-            self.ln()
-
-    def add_totals(self, totals):
-        """
-        Adiciona a tabela de totais ao PDF.
-        """
-        self.ln(10)
-        self.set_font("Arial", "B", 10)
-        self.cell(0, 10, "Totais Gerais", align="C", ln=True)
-        self.ln(5)
-
-        col_widths = [60, 60]
-        self.set_font("Arial", "B", 10)
-        for header, width in zip(["Categoria", "Total"], col_widths):
-            self.cell(width, 10, header, border=1, align="C")
-        self.ln()
-
-        self.set_font("Arial", "", 10)
-        for row in totals:
-            for value, width in zip(row, col_widths):
-                self.cell(width, 10, str(value), border=1, align="C")
-            self.ln()
+def relatorio_semanal_geral():
+    import uuid
+    from blob_store import add_reference, has_blob, maybe_cleanup, put_blob, remove_reference
+    from database import ensure_database
+    from jobs import FINISHED_STATUSES, consolidation_task, get_job, job_result, submit_job
 
+    ensure_database()
 
-def relatorio_semanal_geral():
     st.title("Relatório Semanal Geral")
     st.markdown("### Gerador de relatórios gerais da semana")
 
+    # A sessão guarda só referências pequenas; os bytes ficam no blob_store em disco
     if "pdf_files" not in st.session_state:
         st.session_state.pdf_files = []
+        st.session_state.pdf_digests = set()
+        st.session_state.pdf_upload_ids = {}
+        st.session_state.upload_session_id = uuid.uuid4().hex
+    session_id = st.session_state.upload_session_id
+    maybe_cleanup()
 
     uploaded_pdfs = st.file_uploader(
         "Adicione um ou mais arquivos PDF", type=["pdf"], accept_multiple_files=True, key="pdf_file_uploader"
@@ -652,8 +632,21 @@ def relatorio_semanal_geral():
 
     if uploaded_pdfs:
         for uploaded_pdf in uploaded_pdfs:
-            if uploaded_pdf.name not in [file["name"] for file in st.session_state.pdf_files]:
-                st.session_state.pdf_files.append({"name": uploaded_pdf.name, "data": uploaded_pdf.getvalue()})
+            upload_id = getattr(uploaded_pdf, "file_id", None) or id(uploaded_pdf)
+            if upload_id in st.session_state.pdf_upload_ids:
+                continue
+
+            data = uploaded_pdf.getvalue()
+            with diagnostics.span("blob.put", bytes=len(data)):
+                digest = put_blob(data)
+            diagnostics.count("upload.bytes", len(data))
+            st.session_state.pdf_upload_ids[upload_id] = digest
+            if digest not in st.session_state.pdf_digests:
+                add_reference(session_id, digest)
+                st.session_state.pdf_digests.add(digest)
+                st.session_state.pdf_files.append(
+                    {"name": uploaded_pdf.name, "digest": digest, "size": len(data)}
+                )
                 st.success(f"Arquivo '{uploaded_pdf.name}' adicionado com sucesso!")
             else:
                 st.warning(f"O arquivo '{uploaded_pdf.name}' já foi adicionado.")
@@ -666,81 +659,205 @@ def relatorio_semanal_geral():
             with col1:
                 st.write(f"{idx + 1}. {pdf_file['name']}")
             with col2:
-                delete = st.button(f"🗑️ Excluir", key=f"delete_{pdf_file['name']}_{idx}")
+                delete = st.button(f"🗑️ Excluir", key=f"delete_{pdf_file['digest']}")
                 if not delete:
                     files_to_keep.append(pdf_file)
+                else:
+                    st.session_state.pdf_digests.discard(pdf_file["digest"])
+                    remove_reference(session_id, pdf_file["digest"])
         st.session_state.pdf_files = files_to_keep
 
     if st.button("Gerar Relatório"):
         if not st.session_state.pdf_files:
             st.warning("Nenhum arquivo PDF foi adicionado para análise.")
         else:
-            total_labor = 0
-            total_after = 0
-            total_lucro = 0
-            report_rows = []
-
-            st.markdown("### Relatório Consolidado")
+            # Arquivos expirados no disco saem da lista; os demais têm a referência renovada
+            available = []
             for pdf_file in st.session_state.pdf_files:
-                # Verificar se o arquivo é PM0
-                is_pm0 = "PM0" in pdf_file["name"].upper()
-
-                # Extrair tabelas
-                labor_df = extract_table_with_column(pdf_file["data"], "Labor")
-                total_after_df = extract_table_with_column(pdf_file["data"], "TOTAL after %")
-
-                if labor_df is not None and total_after_df is not None:
-                    # Calcular os totais
-                    labor_sum, after_sum, lucro_sum = calculate_totals(labor_df, total_after_df, is_pm0)
-                    total_labor += labor_sum
-                    total_after += after_sum
-                    total_lucro += lucro_sum
-
-                    # Adicionar linhas ao relatório
-                    report_rows.append([
-                        pdf_file["name"][:3],  # Pegue os 3 primeiros caracteres do nome do arquivo
-                        labor_sum,
-                        after_sum,
-                        lucro_sum
-                    ])
+                if has_blob(pdf_file["digest"]):
+                    add_reference(session_id, pdf_file["digest"])
+                    available.append(pdf_file)
                 else:
-                    st.warning(f"Não foi possível encontrar as tabelas necessárias no arquivo {pdf_file['name']}.")
-
-            # Exibir os totais consolidados na interface
-            st.write(f"**Total Geral Labor:** ${total_labor:,.2f}")
-            st.write(f"**Total Geral TOTAL after %:** ${total_after:,.2f}")
-            st.write(f"**Lucro Geral:** ${total_lucro:,.2f}")
-
-            # Gerar PDF
-            pdf = PDFReport()
-            pdf.add_page()
-
-            # Adicionar a tabela detalhada
-            pdf.add_table(["Installer", "Labor", "TOTAL after %", "Lucro"], report_rows)
-
-            # Adicionar os totais gerais
-            pdf.add_totals([["Labor", f"${total_labor:,.2f}"],
-                            ["TOTAL after %", f"${total_after:,.2f}"],
-                            ["Lucro", f"${total_lucro:,.2f}"]])
-
-            pdf_output = pdf.output(dest="S").encode("latin1")
+                    st.session_state.pdf_digests.discard(pdf_file["digest"])
+                    st.warning(f"O arquivo '{pdf_file['name']}' expirou; adicione-o novamente.")
+            st.session_state.pdf_files = available
+
+            if available:
+                # Extração e PDF consolidado em segundo plano
+                st.session_state.consolidation_job = submit_job(
+                    "consolidation", f"Relatório consolidado ({len(available)} PDF(s))",
+                    consolidation_task, list(available),
+                )
 
+    job_id = st.session_state.get("consolidation_job")
+    job = get_job(job_id) if job_id else None
+    if job is not None and job["status"] not in FINISHED_STATUSES:
+        job_progress(job_id)
+    elif job is not None and job["status"] == "done":
+        summary = job["result"]
+        st.markdown("### Relatório Consolidado")
+        for error in summary["errors"]:
+            st.warning(f"Não foi possível processar o arquivo {error['name']}: {error['error']}")
+
+        # Exibir os totais consolidados na interface
+        st.write(f"**Total Geral Labor:** ${summary['total_labor']:,.2f}")
+        st.write(f"**Total Geral TOTAL after %:** ${summary['total_after']:,.2f}")
+        st.write(f"**Lucro Geral:** ${summary['total_lucro']:,.2f}")
+
+        pdf_output = job_result(job)
+        if pdf_output is not None:
             st.download_button(
                 label="Baixar Relatório em PDF",
                 data=pdf_output,
-                file_name=f"Relatorio_Semanal_{datetime.now().strftime('%d_%m_%Y')}.pdf",
+                file_name=job["result_name"],
                 mime="application/pdf",
             )
+    elif job is not None:
+        st.error(f"Não foi possível gerar o relatório: {job['error']}")
+
+    recent_jobs_panel(["consolidation"], key="consolidation_jobs")
 
     if st.button("Voltar para a Página Inicial"):
         st.session_state.page = "homepage"
 
 
 
+# Painel de diagnóstico: tempos por etapa e contadores da última execução
+def diagnostics_panel(run):
+    with st.expander(f"Diagnóstico ({run['seconds'] * 1000:.0f} ms nesta execução)"):
+        st.caption(f"Execução {run['run']} · execuções nesta sessão: {run['session_reruns']}")
+        if run["totals"]:
+            st.write("**Tempo por etapa (ms)**")
+            st.table({
+                "etapa": list(run["totals"]),
+                "ms": [round(seconds * 1000, 1) for seconds in run["totals"].values()],
+                "chamadas": [sum(1 for record in run["spans"] if record["span"] == name) for name in run["totals"]],
+            })
+        if run["counters"]:
+            st.write("**Contadores**")
+            st.json(run["counters"])
+        if run["spans"]:
+            st.write("**Spans**")
+            st.json(run["spans"], expanded=False)
+
+
 # Função para o Labor Bill
 def LaborBill():
+    from database import (
+        DEFAULT_OFFICE, ensure_database, iter_labor_bill_jobs, query_labor_bill_adjustments,
+        query_labor_bill_installers, query_labor_bill_jobs, query_labor_bill_totals, query_offices
+    )
+    from reports import generate_labor_bill_pdf
+
+    ensure_database()
+
     st.title("Labor Bill")
-    st.markdown("ATLANTA Labor Bill")
+
+    # Filtros: escritório, período de pagamento e instaladores (tudo resolvido no SQLite)
+    offices = query_offices() or [DEFAULT_OFFICE]
+    today = datetime.today().date()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        office = st.selectbox("Escritório", offices + ["Todos"], key="labor_bill_office")
+    with col2:
+        start = st.date_input("Pay date inicial", value=today.replace(day=1), key="labor_bill_start")
+    with col3:
+        end = st.date_input("Pay date final", value=today + timedelta(days=7), key="labor_bill_end")
+    office = None if office == "Todos" else office
+    start, end = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+    st.markdown(f"### {office or 'Todos os escritórios'} Labor Bill")
+    installers = st.multiselect(
+        "Instaladores (vazio = todos)", query_labor_bill_installers(start, end, office), key="labor_bill_installers"
+    )
+
+    totals = query_labor_bill_totals(start, end, office, installers)
+    if totals.empty:
+        st.info("Nenhum serviço salvo para este filtro.")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Jobs", f"{int(totals['Jobs'].sum()):,}")
+        col2.metric("Labor", f"${totals['Total_labor'].sum():,.2f}")
+        col3.metric("TOTAL after %", f"${totals['Total_after'].sum():,.2f}")
+        col4.metric("Total Due", f"${totals['Total_due'].sum():,.2f}")
+        st.dataframe(totals, hide_index=True)
+
+        # Serviços página a página (LIMIT/OFFSET no banco)
+        st.write("#### Serviços")
+        total_jobs = int(totals["Jobs"].sum())
+        col1, col2 = st.columns(2)
+        with col1:
+            page_size = st.selectbox("Linhas por página", [50, 100, 250, 500], index=1, key="labor_bill_page_size")
+        pages = max((total_jobs + page_size - 1) // page_size, 1)
+        with col2:
+            page = st.number_input(f"Página (de {pages})", min_value=1, max_value=pages, value=1, step=1,
+                                   key="labor_bill_page")
+        st.dataframe(
+            query_labor_bill_jobs(start, end, office, installers, limit=page_size, offset=(page - 1) * page_size),
+            hide_index=True,
+        )
+
+        adjustments = query_labor_bill_adjustments(start, end, office, installers)
+        if not adjustments.empty:
+            st.write("#### Extras e Back Charges")
+            st.dataframe(adjustments, hide_index=True)
+
+        if st.button("Gerar Labor Bill (PDF)", key="labor_bill_generate"):
+            with diagnostics.span("pdf.render_labor_bill", jobs=total_jobs):
+                pdf_output = generate_labor_bill_pdf(
+                    office, start, end, totals.to_dict(orient="records"),
+                    iter_labor_bill_jobs(start, end, office, installers),
+                    adjustments.to_dict(orient="records"),
+                )
+            diagnostics.count("pdf.bytes_rendered", len(pdf_output))
+            st.session_state.labor_bill_pdf = ((office, start, end, tuple(installers)), pdf_output)
+
+        # O PDF gerado só vale para o filtro que o gerou
+        bill = st.session_state.get("labor_bill_pdf")
+        if bill is not None and bill[0] == (office, start, end, tuple(installers)):
+            st.download_button(
+                label="Baixar Labor Bill em PDF",
+                data=bill[1],
+                file_name=f"Labor_Bill_{office or 'ALL'}_{start}_{end}.pdf",
+                mime="application/pdf",
+                key="labor_bill_download",
+            )
+
+    if st.button("Voltar para a Página Inicial"):
+        st.session_state.page = "homepage"
+
+
+# Função para o Painel de Análises (lê o resumo materializado em summary)
+def analytics():
+    from database import ensure_database, query_summary, query_summary_totals
+
+    ensure_database()
+
+    st.title("Painel de Análises")
+    st.markdown("### Totais por instalador e semana")
+
+    today = datetime.today().date()
+    col1, col2 = st.columns(2)
+    with col1:
+        start = st.date_input("Semana inicial", value=today - timedelta(weeks=12), key="analytics_start")
+    with col2:
+        end = st.date_input("Semana final", value=today + timedelta(days=7), key="analytics_end")
+    start, end = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+    by_installer = query_summary_totals(start, end, group_by="Installer")
+    if by_installer.empty:
+        st.info("Nenhuma semana salva neste período.")
+    else:
+        st.write("#### Por instalador")
+        st.dataframe(by_installer, hide_index=True)
+
+        by_week = query_summary_totals(start, end, group_by="Pay_date")
+        st.write("#### Por semana")
+        st.line_chart(by_week, x="Pay_date", y=["Total_labor", "Total_price", "Total_lucro"])
+
+        installers = st.multiselect("Instaladores", by_installer["Installer"].tolist(), key="analytics_installers")
+        st.write("#### Detalhe por instalador e semana")
+        st.dataframe(query_summary(start, end, installers), hide_index=True)
 
     if st.button("Voltar para a Página Inicial"):
         st.session_state.page = "homepage"
@@ -754,11 +871,30 @@ if "page" not in st.session_state:
 add_custom_style()
 
 # Controlador de navegação
-if st.session_state.page == "homepage":
-    homepage()
-elif st.session_state.page == "fechamento_semanal":
-    fechamento_semanal()
-elif st.session_state.page == "relatorio_semanal_geral":
-    relatorio_semanal_geral()
-elif st.session_state.page == "Labor Bill":
-    LaborBill()
+try:
+    if st.session_state.page == "homepage":
+        homepage()
+    elif st.session_state.page == "fechamento_semanal":
+        fechamento_semanal()
+    elif st.session_state.page == "relatorio_semanal_geral":
+        relatorio_semanal_geral()
+    elif st.session_state.page == "Labor Bill":
+        LaborBill()
+    elif st.session_state.page == "analytics":
+        analytics()
+finally:
+    # Fecha a medição mesmo quando a página interrompe o script (st.stop/st.rerun)
+    diagnostics_run = diagnostics.finish_run()
+
+if diagnostics_run is not None:
+    diagnostics_panel(diagnostics_run)
+
+# Medição do tempo de carregamento (primeira execução de cada sessão)
+if "startup_seconds" not in st.session_state:
+    st.session_state.startup_seconds = time.perf_counter() - _script_started
+    if st.session_state.startup_seconds > STARTUP_BUDGET_SECONDS:
+        logger.warning("Carregamento inicial levou %.3fs (orçamento: %.1fs, página: %s)",
+                       st.session_state.startup_seconds, STARTUP_BUDGET_SECONDS, st.session_state.page)
+    else:
+        logger.info("Carregamento inicial em %.3fs (página: %s)",
+                    st.session_state.startup_seconds, st.session_state.page)
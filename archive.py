@@ -0,0 +1,132 @@
+import os
+import shutil
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+
+# Arquivo colunar das semanas fechadas: ARCHIVE_DIR/pay_week=AAAA-MM-DD/installer=PMn/*.parquet
+ARCHIVE_DIR = os.path.join("archive", "fechamento_semanal")
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("customer_name", pa.string()),
+    ("job_number", pa.string()),
+    ("labor", pa.float64()),
+    ("expenses", pa.float64()),
+    ("prices_after_percent", pa.float64()),
+    ("discount", pa.float64()),
+    ("back_charge", pa.float64()),
+    ("job_date", pa.string()),
+    ("pay_week", pa.string()),
+    ("installer", pa.string()),
+])
+PARTITIONING = ds.partitioning(
+    pa.schema([("pay_week", pa.string()), ("installer", pa.string())]), flavor="hive"
+)
+
+_archive_lock = threading.Lock()
+
+
+def _archive_table(data):
+    frame = pd.DataFrame({
+        "customer_name": data["customer name"].astype(str),
+        "job_number": data["job number"].astype(str),
+        "labor": pd.to_numeric(data["labor"], errors="coerce"),
+        "expenses": pd.to_numeric(data["expenses"], errors="coerce"),
+        "prices_after_percent": pd.to_numeric(data["prices_after_percent"], errors="coerce"),
+        "discount": pd.to_numeric(data["discount"], errors="coerce"),
+        "back_charge": pd.to_numeric(data.get("back_charge", 0.0), errors="coerce"),
+        "job_date": pd.to_datetime(data["job_date"], errors="coerce").dt.strftime('%Y-%m-%d'),
+        "pay_week": pd.to_datetime(data["pay_date"], errors="coerce").dt.strftime('%Y-%m-%d'),
+        "installer": data["installer"].astype(str),
+    })
+    return pa.Table.from_pandas(frame, schema=ARCHIVE_SCHEMA, preserve_index=False)
+
+
+# Função para arquivar uma semana fechada
+def archive_week(data, archive_dir=None):
+    """
+    Grava as linhas da semana (mesmas colunas de save_week) no dataset
+    Parquet particionado por pay_week e installer. Arquivar de novo a mesma
+    semana substitui a semana inteira, sem duplicar linhas: instaladores que
+    saíram dela não ficam com partições antigas.
+    Retorna o número de linhas arquivadas.
+    """
+    if data.empty:
+        return 0
+    table = _archive_table(data)
+    archive_dir = archive_dir or ARCHIVE_DIR
+    with _archive_lock:
+        for pay_week in pc.unique(table["pay_week"]).to_pylist():
+            shutil.rmtree(os.path.join(archive_dir, f"pay_week={pay_week}"), ignore_errors=True)
+        ds.write_dataset(
+            table,
+            archive_dir,
+            format="parquet",
+            partitioning=PARTITIONING,
+            existing_data_behavior="delete_matching",
+            basename_template="part-{i}.parquet",
+        )
+    return table.num_rows
+
+
+def _dataset(archive_dir=None):
+    path = archive_dir or ARCHIVE_DIR
+    if not os.path.isdir(path):
+        return None
+    return ds.dataset(path, format="parquet", partitioning=PARTITIONING, schema=ARCHIVE_SCHEMA)
+
+
+def _filter(start=None, end=None, installers=None):
+    expression = None
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("pay_week") >= pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if end is not None:
+        conditions.append(ds.field("pay_week") <= pd.Timestamp(end).strftime('%Y-%m-%d'))
+    if installers:
+        conditions.append(ds.field("installer").isin(list(installers)))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+# Função para ler partes do arquivo histórico
+def scan_archive(columns, start=None, end=None, installers=None, archive_dir=None):
+    """
+    Lê apenas as colunas pedidas das partições dentro do intervalo de
+    semanas [start, end] e dos instaladores indicados (filtros nas pastas,
+    sem abrir os outros arquivos). Retorna uma pyarrow.Table.
+    """
+    dataset = _dataset(archive_dir)
+    if dataset is None:
+        return ARCHIVE_SCHEMA.empty_table().select(columns)
+    return dataset.to_table(columns=columns, filter=_filter(start, end, installers))
+
+
+# Função para somar o labor por instalador e trimestre
+def labor_by_installer_quarter(start=None, end=None, installers=None, archive_dir=None):
+    table = scan_archive(["installer", "pay_week", "labor"], start, end, installers, archive_dir)
+    weeks = pc.strptime(table["pay_week"], format="%Y-%m-%d", unit="s")
+    table = table.append_column("year", pc.year(weeks)).append_column("quarter", pc.quarter(weeks))
+    result = table.group_by(["installer", "year", "quarter"]).aggregate([("labor", "sum"), ("labor", "count")])
+    frame = result.to_pandas().rename(columns={"labor_sum": "total_labor", "labor_count": "jobs"})
+    return frame.sort_values(["year", "quarter", "installer"]).reset_index(drop=True)
+
+
+# Função para medir o impacto do desconto das equipes ao longo do tempo
+def discount_impact_over_time(start=None, end=None, installers=None, archive_dir=None):
+    """
+    Por semana: labor total, total após o percentual e o valor retido pelo
+    desconto (labor - prices_after_percent).
+    """
+    table = scan_archive(["pay_week", "labor", "prices_after_percent"], start, end, installers, archive_dir)
+    result = table.group_by("pay_week").aggregate([("labor", "sum"), ("prices_after_percent", "sum")])
+    frame = result.to_pandas().rename(columns={
+        "labor_sum": "total_labor", "prices_after_percent_sum": "total_after_percent",
+    })
+    frame["discount_amount"] = frame["total_labor"] - frame["total_after_percent"]
+    return frame.sort_values("pay_week").reset_index(drop=True)
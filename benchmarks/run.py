@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+# Os módulos do sistema ficam na raiz do repositório
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.synthetic import synthetic_installer_pdf, synthetic_workbook  # noqa: E402
+
+
+DEFAULT_SIZES = [100, 1000, 5000]
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, "benchmarks", "baseline.json")
+PAY_DATE = "2026-10-23"
+
+
+# Função para medir uma função várias vezes
+def measure(func, repeat, setup=None):
+    """
+    Roda setup() (fora do tempo medido) e func() repeat vezes e devolve
+    as estatísticas em segundos.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "repeat": repeat,
+    }
+
+
+# Cada caso recebe o tamanho e devolve {nome: estatísticas}
+def bench_workbook(size, repeat):
+    import workbook
+
+    data = synthetic_workbook(size, PAY_DATE, weeks=4, seed=size)
+
+    def cold():
+        workbook.clear_workbook_cache()
+        shutil.rmtree(workbook.SIDECAR_DIR, ignore_errors=True)
+
+    def sidecar():
+        workbook.clear_workbook_cache()
+
+    results = {
+        "workbook.read_full": measure(
+            lambda: workbook.read_payroll_workbook(data, projected=False), repeat, workbook.clear_workbook_cache
+        ),
+        "workbook.read_projected_cold": measure(lambda: workbook.read_payroll_workbook(data), repeat, cold),
+    }
+    workbook.read_payroll_workbook(data)
+    results["workbook.read_projected_sidecar"] = measure(
+        lambda: workbook.read_payroll_workbook(data), repeat, sidecar
+    )
+    results["workbook.read_cached"] = measure(lambda: workbook.read_payroll_workbook(data), repeat)
+    return results
+
+
+def bench_payouts(size, repeat):
+    from payouts import TEAM_DISCOUNTS, compute_payouts
+    from pipeline import prepare_week
+    from workbook import read_payroll_workbook
+
+    week = prepare_week(read_payroll_workbook(synthetic_workbook(size, PAY_DATE, seed=size)), PAY_DATE)
+    return {
+        "payouts.compute_payouts": measure(lambda: compute_payouts(week, TEAM_DISCOUNTS), repeat),
+    }
+
+
+def bench_pdf(size, repeat):
+    from pdf_extract import LABOR_COLUMN, REPORT_COLUMNS, TOTAL_AFTER_COLUMN, extract_tables, sum_totals
+    from reports import read_report_payload
+
+    # Um relatório de instalador tem uma fração dos serviços da semana
+    jobs = max(size // 8, 10)
+    results = {
+        "reports.generate_detailed_pdf": measure(
+            lambda: synthetic_installer_pdf(jobs, seed=size), repeat
+        ),
+    }
+
+    with_payload = synthetic_installer_pdf(jobs, seed=size)
+    legacy = synthetic_installer_pdf(jobs, seed=size, embed_payload=False)
+    tables = extract_tables(legacy, REPORT_COLUMNS)
+
+    results["pdf_extract.read_report_payload"] = measure(lambda: read_report_payload(with_payload), repeat)
+    results["pdf_extract.extract_tables"] = measure(lambda: extract_tables(legacy, REPORT_COLUMNS), repeat)
+    results["pdf_extract.extract_labor_only"] = measure(lambda: extract_tables(legacy, [LABOR_COLUMN]), repeat)
+    results["pdf_extract.sum_totals"] = measure(
+        lambda: sum_totals(tables.get(LABOR_COLUMN), tables.get(TOTAL_AFTER_COLUMN), False), repeat
+    )
+    return results
+
+
+def bench_database(size, repeat):
+    from concurrent.futures import ThreadPoolExecutor
+    from database import (
+        DATABASE_PATH, close_connection, create_tables, get_connection, query_labor_bill_totals,
+        save_to_database, sync_week,
+    )
+    from payouts import TEAM_DISCOUNTS, compute_payouts
+    from pipeline import prepare_week, week_database_frame
+    from workbook import read_payroll_workbook
+
+    week = prepare_week(read_payroll_workbook(synthetic_workbook(size, PAY_DATE, seed=size)), PAY_DATE)
+    jobs, _ = compute_payouts(week, TEAM_DISCOUNTS)
+    rows = week_database_frame(jobs, PAY_DATE)
+
+    def fresh_database():
+        close_connection()
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            try:
+                os.remove(DATABASE_PATH + suffix)
+            except FileNotFoundError:
+                pass
+        create_tables()
+
+    results = {"database.save_to_database": measure(lambda: save_to_database(rows), repeat, fresh_database)}
+
+    # Conferir a gravação e medir de novo com o banco já populado
+    fresh_database()
+    save_to_database(rows)
+    saved = get_connection().execute("SELECT COUNT(*) FROM fechamento_semanal").fetchone()[0]
+    if saved != len(rows):
+        raise RuntimeError(f"save_to_database gravou {saved} linhas, esperado {len(rows)}")
+    results["database.save_to_database_populated"] = measure(lambda: save_to_database(rows), repeat)
+
+    # Sincronizar a mesma semana de novo: nada muda, só leitura das impressões digitais
+    fresh_database()
+    sync_week(rows)
+    results["database.sync_week_unchanged"] = measure(lambda: sync_week(rows), repeat)
+
+    # Fechamento de sexta com vários usuários: gravações e leituras ao mesmo tempo
+    edited = rows.copy()
+    edited["labor"] = edited["labor"] + 1
+
+    def concurrent_closing():
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            saves = [executor.submit(sync_week, rows if idx % 2 else edited) for idx in range(4)]
+            reads = [executor.submit(query_labor_bill_totals, PAY_DATE, PAY_DATE) for _ in range(8)]
+            for future in saves + reads:
+                future.result()
+
+    results["database.concurrent_closing"] = measure(concurrent_closing, repeat)
+    return results
+
+
+BENCHMARKS = {
+    "workbook": bench_workbook,
+    "payouts": bench_payouts,
+    "pdf": bench_pdf,
+    "database": bench_database,
+}
+
+
+# Função para rodar a suíte inteira em uma pasta temporária
+def run_suite(sizes, repeat, only=None):
+    """
+    Roda os casos selecionados para cada tamanho dentro de uma pasta
+    temporária (banco, caches e cópias Parquet não tocam o repositório).
+    Retorna {"tamanho": {caso: estatísticas}}.
+    """
+    from database import use_database
+
+    results = {}
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="pmhrs-bench-") as work_dir:
+        os.chdir(work_dir)
+        previous_database = use_database(os.path.join(work_dir, "fechamento_semanal.db"))
+        try:
+            for size in sizes:
+                results[str(size)] = {}
+                for name, bench in BENCHMARKS.items():
+                    if only and name not in only:
+                        continue
+                    results[str(size)].update(bench(size, repeat))
+                    print(f"  {name} @ {size} linhas: ok", file=sys.stderr)
+        finally:
+            use_database(previous_database)
+            os.chdir(previous_dir)
+    return results
+
+
+def environment():
+    import numpy
+    import pandas
+    import pdfplumber
+    import pyarrow
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "pyarrow": pyarrow.__version__,
+        "pdfplumber": pdfplumber.__version__,
+    }
+
+
+# Função para comparar uma execução com a linha de base
+def compare(results, baseline, tolerance):
+    """
+    Devolve as linhas da tabela de comparação e a lista de regressões
+    (mediana acima de baseline * (1 + tolerance)).
+    """
+    lines, regressions = [], []
+    for size, cases in results.items():
+        for case, stats in cases.items():
+            base = baseline.get("results", {}).get(size, {}).get(case)
+            if base is None:
+                lines.append(f"{case:<40} {size:>6} {stats['median'] * 1000:>10.1f}ms {'(novo)':>12}")
+                continue
+            ratio = stats["median"] / base["median"] if base["median"] else float("inf")
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  REGRESSÃO"
+                regressions.append((case, size, ratio))
+            lines.append(
+                f"{case:<40} {size:>6} {stats['median'] * 1000:>10.1f}ms "
+                f"{base['median'] * 1000:>10.1f}ms {ratio:>6.2f}x{flag}"
+            )
+    return lines, regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks dos caminhos críticos com planilhas e PDFs sintéticos (offline).",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help=f"Linhas da planilha sintética (padrão: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetições por caso (padrão: 5)")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=None,
+                        help="Rodar só alguns grupos de casos")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Arquivo JSON da linha de base")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Grava esta execução como a nova linha de base")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Folga antes de acusar regressão (padrão: 0.25 = 25%%)")
+    parser.add_argument("--output", default=None, help="Grava também o resultado desta execução em JSON")
+    return parser
+
+
+# Ponto de entrada: python -m benchmarks.run
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    run = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "repeat": args.repeat,
+        "results": run_suite(args.sizes, args.repeat, args.only),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Linha de base gravada em {args.baseline}")
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    lines, regressions = compare(run["results"], baseline, args.tolerance)
+    print(f"{'caso':<40} {'linhas':>6} {'mediana':>12} {'base':>12} {'razão':>7}")
+    print("\n".join(lines))
+
+    if baseline and baseline.get("environment") != run["environment"]:
+        print("Aviso: linha de base gravada em outro ambiente; compare com cuidado.")
+    if regressions:
+        print(f"{len(regressions)} regressão(ões) acima de {args.tolerance:.0%}.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
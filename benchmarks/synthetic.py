@@ -0,0 +1,107 @@
+import io
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+
+# Códigos de instalador como aparecem nas planilhas reais (com variações de escrita)
+INSTALLER_CODES = ["PM0", "PM1", "PM2", "PM3", "PM4", "PM5", "PM6", "PM7", "PM8"]
+INSTALLER_SPELLINGS = ["{code}", "{code} ", "{lower}", "{code} - Team", "Installer {code}"]
+
+CITIES = ["Atlanta", "Marietta", "Decatur", "Roswell", "Alpharetta", "Smyrna", "Kennesaw"]
+STREETS = ["Peachtree St", "Main St", "Oak Ave", "Pine Rd", "Maple Dr", "Cedar Ln"]
+
+
+# Função para gerar os serviços de uma planilha de pagamentos sintética
+def synthetic_jobs(rows, pay_date, weeks=1, seed=0):
+    """
+    Gera rows serviços distribuídos entre os instaladores e entre as weeks
+    sextas-feiras que terminam em pay_date. Mesma seed, mesmos dados.
+    """
+    rng = np.random.default_rng(seed)
+    pay_date = pd.Timestamp(pay_date)
+    pay_dates = [pay_date - timedelta(weeks=week) for week in range(weeks)]
+
+    codes = rng.choice(INSTALLER_CODES, size=rows, p=[0.06, 0.14, 0.14, 0.12, 0.12, 0.12, 0.1, 0.1, 0.1])
+    spellings = rng.choice(INSTALLER_SPELLINGS, size=rows, p=[0.7, 0.1, 0.1, 0.05, 0.05])
+    installers = [
+        spelling.format(code=code, lower=code.lower()) for code, spelling in zip(codes, spellings)
+    ]
+    row_pay_dates = [pay_dates[idx] for idx in rng.integers(0, weeks, size=rows)]
+    job_dates = [
+        day - timedelta(days=int(offset)) for day, offset in zip(row_pay_dates, rng.integers(3, 12, size=rows))
+    ]
+    labor = np.round(rng.gamma(shape=2.0, scale=450.0, size=rows) + 80, 2)
+    despesas = np.where(rng.random(rows) < 0.3, np.round(rng.uniform(5, 250, size=rows), 2), 0.0)
+
+    return pd.DataFrame({
+        "Installer": installers,
+        "Pay Date": row_pay_dates,
+        "Labor": labor,
+        "Despesas": despesas,
+        "Address": [f"{rng.integers(10, 9999)} {rng.choice(STREETS)}" for _ in range(rows)],
+        "City": rng.choice(CITIES, size=rows),
+        "Phone": [f"(404) {rng.integers(200, 999)}-{rng.integers(1000, 9999)}" for _ in range(rows)],
+        "Job #": [f"J{seed:02d}{idx:06d}" for idx in range(rows)],
+        "Unnamed: 8": [f"Customer {idx:06d}" for idx in range(rows)],
+        "Date": job_dates,
+        "Notes": rng.choice(["", "Rush", "Callback", "Warranty", ""], size=rows),
+    })
+
+
+# Função para gerar a planilha (.xlsx) no formato header=1
+def synthetic_workbook(rows, pay_date, weeks=1, seed=0):
+    """
+    Devolve os bytes de um .xlsx com uma linha de título e o cabeçalho na
+    linha 2, como as planilhas lidas por read_payroll_workbook().
+    A coluna do cliente fica sem título (vira 'unnamed: 8' na leitura).
+    """
+    jobs = synthetic_jobs(rows, pay_date, weeks, seed)
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        pd.DataFrame([["Payroll - synthetic"]]).to_excel(writer, index=False, header=False, startrow=0)
+        jobs.to_excel(writer, index=False, startrow=1)
+
+    # Apagar o título da coluna do cliente, como nas planilhas reais
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(buffer.getvalue()))
+    sheet = workbook.worksheets[0]
+    sheet.cell(row=2, column=jobs.columns.get_loc("Unnamed: 8") + 1).value = None
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+# Função para gerar o PDF de um instalador com generate_detailed_pdf()
+def synthetic_installer_pdf(jobs, installer="PM2", pay_date="2026-10-23", seed=0, embed_payload=True):
+    """
+    Monta um relatório de instalador com jobs serviços pelo mesmo caminho
+    do fechamento (build_installer_report + generate_detailed_pdf).
+    Com embed_payload=False os dados embutidos são removidos, para medir a
+    extração pelo pdfplumber como em PDFs antigos.
+    """
+    from payouts import TEAM_DISCOUNTS, compute_payouts
+    from reports import PAYLOAD_PREFIX, build_installer_report, generate_detailed_pdf
+
+    period = pd.Timestamp(pay_date).strftime('%Y-%m-%d')
+    frame = synthetic_jobs(jobs, pay_date, seed=seed)
+    week = pd.DataFrame({
+        "installer": installer,
+        "customer name": frame["Unnamed: 8"],
+        "job number": frame["Job #"],
+        "labor": frame["Labor"],
+        "despesas": frame["Despesas"],
+        "when the job was done": frame["Date"].dt.strftime('%Y-%m-%d'),
+    })
+    extras = [{"name": "Extra service", "value": 150.0, "date": period}]
+    installer_jobs, payouts = compute_payouts(week, TEAM_DISCOUNTS, {installer: extras}, {installer: 25.0})
+    report = build_installer_report(
+        installer, installer_jobs, payouts.loc[installer, "final_total"], period, extras, 25.0
+    )
+    content = generate_detailed_pdf(**report)
+    if not embed_payload:
+        marker = PAYLOAD_PREFIX.encode("latin-1")
+        content = content.replace(marker, b"X" * len(marker))
+    return content
@@ -0,0 +1,127 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+
+
+# Arquivos enviados guardados em disco pelo SHA-256 do conteúdo:
+#   BLOB_DIR/objects/ab/abcdef....   conteúdo (uma cópia por digest)
+#   BLOB_DIR/refs/<sessão>/<digest>  referência de uma sessão (mtime = último uso)
+BLOB_DIR = os.path.join(".cache", "blobs")
+BLOB_TTL_SECONDS = 12 * 60 * 60
+CLEANUP_INTERVAL_SECONDS = 10 * 60
+
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+def _object_path(digest):
+    return os.path.join(BLOB_DIR, "objects", digest[:2], digest)
+
+
+def _ref_path(session_id, digest):
+    return os.path.join(BLOB_DIR, "refs", session_id, digest)
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a"):
+        pass
+    os.utime(path, None)
+
+
+# Função para guardar um arquivo e devolver o digest
+def put_blob(data):
+    digest = hashlib.sha256(data).hexdigest()
+    path = _object_path(digest)
+    if os.path.exists(path):
+        os.utime(path, None)
+        return digest
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return digest
+
+
+# Função para ler um arquivo guardado
+def get_blob(digest):
+    with open(_object_path(digest), "rb") as f:
+        return f.read()
+
+
+def has_blob(digest):
+    return os.path.exists(_object_path(digest))
+
+
+# Funções para as referências de cada sessão
+def add_reference(session_id, digest):
+    _touch(_ref_path(session_id, digest))
+
+
+def remove_reference(session_id, digest):
+    try:
+        os.remove(_ref_path(session_id, digest))
+    except FileNotFoundError:
+        pass
+
+
+# Função para apagar referências vencidas e arquivos sem referência
+def cleanup_expired(ttl_seconds=BLOB_TTL_SECONDS):
+    """
+    Remove referências sem uso há mais de ttl_seconds e, depois, os arquivos
+    que não têm nenhuma referência e também estão parados há mais de
+    ttl_seconds. Retorna o número de arquivos apagados.
+    """
+    now = time.time()
+    referenced = set()
+
+    refs_dir = os.path.join(BLOB_DIR, "refs")
+    if os.path.isdir(refs_dir):
+        for session_id in os.listdir(refs_dir):
+            session_dir = os.path.join(refs_dir, session_id)
+            for digest in os.listdir(session_dir):
+                path = os.path.join(session_dir, digest)
+                try:
+                    if now - os.path.getmtime(path) > ttl_seconds:
+                        os.remove(path)
+                    else:
+                        referenced.add(digest)
+                except OSError:
+                    pass
+            try:
+                os.rmdir(session_dir)
+            except OSError:
+                pass
+
+    removed = 0
+    objects_dir = os.path.join(BLOB_DIR, "objects")
+    if os.path.isdir(objects_dir):
+        for root, _, files in os.walk(objects_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name in referenced:
+                    continue
+                try:
+                    if now - os.path.getmtime(path) > ttl_seconds:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+# Função para limpar no máximo uma vez a cada CLEANUP_INTERVAL_SECONDS por processo
+def maybe_cleanup():
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < CLEANUP_INTERVAL_SECONDS:
+        return
+    with _cleanup_lock:
+        if now - _last_cleanup < CLEANUP_INTERVAL_SECONDS:
+            return
+        _last_cleanup = now
+    cleanup_expired()
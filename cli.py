@@ -0,0 +1,81 @@
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+
+from database import create_tables
+from pipeline import close_week, close_weeks
+from workbook import read_payroll_workbook
+
+
+def _next_friday():
+    today = datetime.today()
+    return (today + timedelta((4 - today.weekday()) % 7)).strftime('%Y-%m-%d')
+
+
+def _parse_back_charge(value):
+    installer, _, amount = value.partition("=")
+    if not installer or not amount:
+        raise argparse.ArgumentTypeError(f"use INSTALLER=VALOR (recebido: {value!r})")
+    try:
+        return installer.strip().upper(), float(amount)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"valor inválido em {value!r}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Fechamento semanal sem interface: PDFs dos instaladores, relatório consolidado e banco.",
+    )
+    parser.add_argument("workbook", help="Planilha de pagamentos (.xlsx/.xlsm, cabeçalho na linha 2)")
+    parser.add_argument("--pay-date", default=None,
+                        help="Data de pagamento AAAA-MM-DD (padrão: próxima sexta-feira)")
+    parser.add_argument("--until", default=None, metavar="AAAA-MM-DD",
+                        help="Fecha em lote todas as semanas de --pay-date até esta data (inclusive)")
+    parser.add_argument("--output-dir", default="reports", help="Pasta de saída dos PDFs (padrão: reports)")
+    parser.add_argument("--back-charge", action="append", default=[], type=_parse_back_charge,
+                        metavar="INSTALLER=VALOR", help="Back charge de um instalador (pode repetir)")
+    parser.add_argument("--no-db", action="store_true", help="Não grava as linhas no banco de dados")
+    return parser
+
+
+# Ponto de entrada da linha de comando
+def main(argv=None):
+    """
+    Executa o fechamento e imprime um resumo em JSON na saída padrão.
+    Código de saída: 0 sucesso, 1 erro no processamento ou semana sem
+    pagamentos, 2 argumentos inválidos.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.until and args.back_charge:
+        parser.error("--back-charge vale para uma semana só; não use junto com --until")
+    pay_date = args.pay_date or _next_friday()
+    summary = {"workbook": args.workbook, "pay_date": pay_date, "status": "ok"}
+
+    try:
+        datetime.strptime(pay_date, '%Y-%m-%d')
+        if args.until:
+            datetime.strptime(args.until, '%Y-%m-%d')
+        with open(args.workbook, "rb") as f:
+            workbook_df = read_payroll_workbook(f.read())
+        if not args.no_db:
+            create_tables()
+        if args.until:
+            summary.update(close_weeks(workbook_df, pay_date, args.until, args.output_dir, save=not args.no_db))
+        else:
+            summary.update(close_week(
+                workbook_df, pay_date, args.output_dir, save=not args.no_db, back_charges=dict(args.back_charge),
+            ))
+        if summary["jobs"] == 0:
+            summary["status"] = "empty"
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = f"{type(e).__name__}: {e}"
+
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary["status"] == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from blob_store import get_blob
+from database import get_cached_extraction, store_extraction
+from reports import read_report_payload
+from pdf_extract import (
+    EXTRACTOR_VERSION, LABOR_COLUMN, TOTAL_AFTER_COLUMN, compute_lucro, extract_tables, sum_totals
+)
+
+
+def _empty_result(name, error=None):
+    return {"name": name, "labor": 0.0, "total_after": 0.0, "lucro": 0.0, "error": error}
+
+
+# Função para os totais que não precisam do pdfplumber (payload embutido ou cache)
+def known_totals(name, data, digest=None):
+    """
+    Devolve o resultado de um PDF gerado pelo sistema (totais embutidos) ou
+    já extraído antes (cache no banco), ou None se for preciso extrair as
+    tabelas. Leva microssegundos; roda no processo de quem chamou.
+    """
+    is_pm0 = "PM0" in name.upper()
+    result = _empty_result(name)
+
+    # PDF gerado pelo sistema: lê os totais embutidos, sem análise de layout
+    payload = read_report_payload(data)
+    if payload is not None:
+        total_labor = sum(job["labor"] for job in payload["jobs"])
+        total_after = payload["final_total"]
+        result["labor"], result["total_after"] = total_labor, total_after
+        result["lucro"] = compute_lucro(total_labor, total_after, is_pm0)
+        return result
+
+    # PDF já visto: uma consulta indexada no banco, sem pdfplumber
+    cached = get_cached_extraction(digest or hashlib.sha256(data).hexdigest(), EXTRACTOR_VERSION)
+    if cached is not None:
+        _, _, total_labor, total_after = cached
+        result["labor"], result["total_after"] = total_labor, total_after
+        result["lucro"] = compute_lucro(total_labor, total_after, is_pm0)
+        return result
+    return None
+
+
+# Função executada em cada processo: extrai as tabelas e soma um PDF
+def extract_pdf(name, data=None, digest=None):
+    """
+    Extrai as tabelas com o pdfplumber, soma e guarda no cache do banco.
+    Devolve um dicionário com name, labor, total_after, lucro e error (None
+    quando deu certo). Os bytes vêm de data ou, se None, do blob_store pelo
+    digest. Nunca levanta exceção, para não derrubar o lote inteiro.
+    """
+    result = _empty_result(name)
+    try:
+        if data is None:
+            data = get_blob(digest)
+        digest = digest or hashlib.sha256(data).hexdigest()
+
+        tables = extract_tables(data)
+        labor_df = tables.get(LABOR_COLUMN)
+        total_after_df = tables.get(TOTAL_AFTER_COLUMN)
+        if labor_df is None or total_after_df is None:
+            result["error"] = "Não foi possível encontrar as tabelas necessárias."
+            return result
+
+        is_pm0 = "PM0" in name.upper()
+        result["labor"], result["total_after"], result["lucro"] = sum_totals(labor_df, total_after_df, is_pm0)
+        store_extraction(digest, EXTRACTOR_VERSION, labor_df, total_after_df,
+                         result["labor"], result["total_after"])
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def _default_workers(n_files):
+    return max(1, min(os.cpu_count() or 1, n_files))
+
+
+# Função para consolidar vários PDFs em paralelo
+def consolidate_pdfs(pdf_files, max_workers=None, on_progress=None):
+    """
+    Recebe dicionários com "name" e "data", ou "name" e "digest" de um
+    arquivo do blob_store. Os totais embutidos e os já guardados no cache
+    são lidos aqui mesmo; só os PDFs que precisam do pdfplumber vão para um
+    pool de processos (e só se forem mais de um).
+    Os resultados voltam na mesma ordem de pdf_files, independente da ordem
+    de término. on_progress(concluidos, total, resultado) é chamado na thread
+    de quem chamou a cada arquivo terminado.
+    """
+    total = len(pdf_files)
+    results = [None] * total
+    done = 0
+
+    def finished(idx, result):
+        nonlocal done
+        results[idx] = result
+        done += 1
+        if on_progress:
+            on_progress(done, total, result)
+
+    pending = []
+    for idx, pdf_file in enumerate(pdf_files):
+        name, digest = pdf_file["name"], pdf_file.get("digest")
+        try:
+            data = pdf_file.get("data")
+            if data is None:
+                data = get_blob(digest)
+            result = known_totals(name, data, digest)
+        except Exception as e:
+            result = _empty_result(name, str(e))
+        if result is None:
+            pending.append(idx)
+        else:
+            finished(idx, result)
+
+    workers = max_workers or _default_workers(len(pending))
+    if workers == 1 or len(pending) <= 1:
+        for idx in pending:
+            pdf_file = pdf_files[idx]
+            finished(idx, extract_pdf(pdf_file["name"], pdf_file.get("data"), pdf_file.get("digest")))
+        return results
+
+    # "spawn" evita fork de um processo com várias threads (servidor Streamlit)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {
+            pool.submit(
+                extract_pdf, pdf_files[idx]["name"], pdf_files[idx].get("data"), pdf_files[idx].get("digest")
+            ): idx
+            for idx in pending
+        }
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = _empty_result(pdf_files[idx]["name"], str(e))
+            finished(idx, result)
+    return results
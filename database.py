@@ -0,0 +1,1062 @@
+import io
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import pandas as pd
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from diagnostics import count, span, timed
+
+
+# Caminho absoluto do banco, resolvido uma vez: mudar de pasta depois não
+# cria outro arquivo. PMHRS_DATABASE troca o arquivo (ex.: testes, outra loja).
+DATABASE_PATH = os.path.abspath(os.environ.get("PMHRS_DATABASE", "fechamento_semanal.db"))
+
+# WAL deixa as leituras rodarem junto com a gravação; busy_timeout espera em
+# vez de falhar com "database is locked" (ex.: o CLI gravando ao mesmo tempo).
+BUSY_TIMEOUT_SECONDS = 15
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_SECONDS * 1000}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+]
+
+
+class ThreadConnection(sqlite3.Connection):
+    """
+    Conexão reaproveitada por todas as funções da mesma thread. close() não
+    fecha de verdade (a conexão volta a ficar disponível); ela é fechada com
+    close_connection() ou quando a thread termina.
+    """
+
+    def close(self):
+        pass
+
+
+_connections = threading.local()
+_database_generation = 0
+
+# Uma gravação por vez no processo: quem chega espera aqui, e não no SQLite
+_writer_lock = threading.RLock()
+
+
+# Conexão com o banco de dados (uma por thread, já configurada)
+def get_connection():
+    conn = getattr(_connections, "conn", None)
+    if conn is not None and _connections.generation == _database_generation:
+        return conn
+    close_connection()
+    conn = sqlite3.connect(
+        DATABASE_PATH, timeout=BUSY_TIMEOUT_SECONDS, factory=ThreadConnection
+    )
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    _connections.conn = conn
+    _connections.generation = _database_generation
+    count("db.connections_opened")
+    return conn
+
+
+# Função para fechar de verdade a conexão desta thread
+def close_connection():
+    conn = getattr(_connections, "conn", None)
+    _connections.conn = None
+    if conn is not None:
+        sqlite3.Connection.close(conn)
+
+
+# Função para apontar o sistema para outro arquivo de banco
+def use_database(path):
+    """
+    Troca DATABASE_PATH; as conexões abertas (de todas as threads) são
+    reabertas no próximo get_connection(). Retorna o caminho anterior.
+    """
+    global DATABASE_PATH, _database_generation, _database_ready
+    previous = DATABASE_PATH
+    with _writer_lock:
+        close_connection()
+        DATABASE_PATH = os.path.abspath(path)
+        _database_generation += 1
+        _database_ready = False
+    return previous
+
+
+# Transação de escrita: with write_transaction() as conn: ...
+@contextmanager
+def write_transaction():
+    """
+    Serializa as gravações do processo (uma de cada vez) e abre a transação
+    com BEGIN IMMEDIATE, que reserva a escrita logo no início: nada de
+    "database is locked" no meio do caminho. Commit no fim, rollback em caso
+    de erro. Dentro de outra write_transaction() da mesma thread, apenas
+    reaproveita a transação aberta.
+    """
+    conn = get_connection()
+    with span("db.writer_wait"):
+        _writer_lock.acquire()
+    try:
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        count("db.write_transactions")
+    finally:
+        _writer_lock.release()
+
+
+# Tabelas do sistema no formato atual (datas sempre em texto ISO AAAA-MM-DD)
+FECHAMENTO_SEMANAL_DDL = """
+CREATE TABLE fechamento_semanal (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Installer TEXT NOT NULL,
+    Customer_name TEXT NOT NULL,
+    Job_number TEXT NOT NULL,
+    Labor REAL NOT NULL,
+    Expenses REAL NOT NULL,
+    Pay_date TEXT NOT NULL,
+    Job_date TEXT NOT NULL,
+    Prices_after_percent REAL NOT NULL,
+    Discount REAL NOT NULL,
+    Extras_details TEXT,
+    Back_charge REAL NOT NULL
+)
+"""
+
+EXTRAS_DDL = """
+CREATE TABLE extras (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Installer TEXT NOT NULL,
+    Extra_name TEXT NOT NULL,
+    Extra_value REAL NOT NULL,
+    Extra_date TEXT NOT NULL
+)
+"""
+
+BACK_CHARGES_DDL = """
+CREATE TABLE back_charges (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Installer TEXT NOT NULL,
+    Back_charge REAL NOT NULL,
+    Reason TEXT
+)
+"""
+
+SUMMARY_DDL = """
+CREATE TABLE summary (
+    Id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Installer TEXT NOT NULL,
+    Total_labor REAL NOT NULL,
+    Total_expenses REAL NOT NULL,
+    Total_extras REAL NOT NULL,
+    Total_back_charges REAL NOT NULL,
+    Total_price REAL NOT NULL,
+    Report_date TEXT NOT NULL
+)
+"""
+
+PDF_EXTRACTION_CACHE_DDL = """
+CREATE TABLE IF NOT EXISTS pdf_extraction_cache (
+    Pdf_digest TEXT NOT NULL,
+    Extractor_version INTEGER NOT NULL,
+    Labor_table TEXT NOT NULL,
+    Total_after_table TEXT NOT NULL,
+    Total_labor REAL NOT NULL,
+    Total_after REAL NOT NULL,
+    Created_at TEXT NOT NULL,
+    PRIMARY KEY (Pdf_digest, Extractor_version)
+)
+"""
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _rebuild_table(conn, table, ddl, sources):
+    """
+    Recria a tabela com o DDL novo e copia as linhas da versão antiga, se
+    existir. sources é {coluna_nova: [colunas antigas candidatas]}; a primeira
+    candidata presente é usada. Colunas de data passam por date() para ficarem
+    no formato ISO ordenável.
+    """
+    old_columns = _table_columns(conn, table)
+    if not old_columns:
+        conn.execute(ddl)
+        return
+
+    backup = f"_{table}_old"
+    conn.execute(f"ALTER TABLE {table} RENAME TO {backup}")
+    conn.execute(ddl)
+
+    new_columns, expressions = [], []
+    for new_col, candidates in sources.items():
+        found = next((col for col in candidates if col in old_columns), None)
+        if found is None:
+            continue
+        expression = f'"{found}"'
+        if new_col.endswith("_date"):
+            expression = f"COALESCE(date({expression}), {expression})"
+        new_columns.append(new_col)
+        expressions.append(expression)
+
+    conn.execute(
+        f"INSERT INTO {table} ({', '.join(new_columns)}) SELECT {', '.join(expressions)} FROM {backup}"
+    )
+    conn.execute(f"DROP TABLE {backup}")
+
+
+# Migração 1: corrige as colunas quebradas das tabelas originais e cria os índices
+def _migration_1(conn):
+    _rebuild_table(conn, "fechamento_semanal", FECHAMENTO_SEMANAL_DDL, {
+        "Id": ["Id"],
+        "Installer": ["Installer"],
+        "Customer_name": ["Customer_name"],
+        "Job_number": ["Job_number"],
+        "Labor": ["Labor", "Labor_REAL"],
+        "Expenses": ["Expenses"],
+        "Pay_date": ["Pay_date"],
+        "Job_date": ["Job_date"],
+        "Prices_after_percent": ["Prices_after_percent"],
+        "Discount": ["Discount"],
+        "Extras_details": ["Extras_details"],
+        "Back_charge": ["Back_charge"],
+    })
+    _rebuild_table(conn, "extras", EXTRAS_DDL, {
+        "Id": ["Id"],
+        "Installer": ["Installer"],
+        "Extra_name": ["Extra_name"],
+        "Extra_value": ["Extra_value"],
+        "Extra_date": ["Extra_date"],
+    })
+    _rebuild_table(conn, "back_charges", BACK_CHARGES_DDL, {
+        "Id": ["Id"],
+        "Installer": ["Installer"],
+        "Back_charge": ["Back_charge"],
+        "Reason": ["Reason", "reason"],
+    })
+    _rebuild_table(conn, "summary", SUMMARY_DDL, {
+        "Id": ["Id"],
+        "Installer": ["Installer"],
+        "Total_labor": ["Total_labor"],
+        "Total_expenses": ["Total_expenses"],
+        "Total_extras": ["Total_extras"],
+        "Total_back_charges": ["Total_back_charges"],
+        "Total_price": ["Total_price"],
+        "Report_date": ["Report_date", "Report"],
+    })
+    conn.execute(PDF_EXTRACTION_CACHE_DDL)
+
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_fechamento_semanal_pay_date_installer
+    ON fechamento_semanal (Pay_date, Installer)
+    """)
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_fechamento_semanal_job_number
+    ON fechamento_semanal (Job_number)
+    """)
+
+
+# Consulta que recalcula o resumo (summary) por instalador e semana a partir
+# dos serviços, extras e back charges; {where} restringe as semanas.
+SUMMARY_ROLLUP_SQL = """
+INSERT INTO summary (
+    Installer, Pay_date, Jobs, Total_labor, Total_expenses, Total_extras,
+    Total_back_charges, Total_price, Total_lucro, Report_date
+)
+SELECT Installer, Pay_date, Jobs, Total_labor, Total_expenses, Total_extras, Total_back_charges,
+       Total_price,
+       CASE WHEN Installer = 'PM0' THEN Total_price ELSE Total_labor - Total_price END,
+       date('now')
+FROM (
+    SELECT j.Installer, j.Pay_date, j.Jobs, j.Total_labor, j.Total_expenses,
+           COALESCE(e.Total_extras, 0) AS Total_extras,
+           j.Row_back_charges + COALESCE(b.Total_back_charges, 0) AS Total_back_charges,
+           j.Total_after + COALESCE(e.Total_extras, 0)
+               - j.Row_back_charges - COALESCE(b.Total_back_charges, 0) AS Total_price
+    FROM (
+        SELECT Installer, Pay_date, COUNT(*) AS Jobs, SUM(Labor) AS Total_labor,
+               SUM(Expenses) AS Total_expenses, SUM(Prices_after_percent) AS Total_after,
+               SUM(Back_charge) AS Row_back_charges
+        FROM fechamento_semanal
+        WHERE {where}
+        GROUP BY Installer, Pay_date
+    ) j
+    LEFT JOIN (
+        SELECT Installer, Pay_date, SUM(Extra_value) AS Total_extras
+        FROM extras
+        WHERE {where}
+        GROUP BY Installer, Pay_date
+    ) e ON e.Installer = j.Installer AND e.Pay_date = j.Pay_date
+    LEFT JOIN (
+        SELECT Installer, Pay_date, SUM(Back_charge) AS Total_back_charges
+        FROM back_charges
+        WHERE {where}
+        GROUP BY Installer, Pay_date
+    ) b ON b.Installer = j.Installer AND b.Pay_date = j.Pay_date
+)
+"""
+
+
+# Função para recalcular o resumo de algumas semanas (dentro da transação de quem chama)
+@timed("db.refresh_summary")
+def refresh_summary(conn, pay_dates=None):
+    """
+    Apaga e recalcula as linhas de summary das semanas em pay_dates (todas,
+    se None) com GROUP BY dentro do SQLite. Não faz commit.
+    """
+    if pay_dates is None:
+        conn.execute("DELETE FROM summary")
+        conn.execute(SUMMARY_ROLLUP_SQL.format(where="1 = 1"))
+        return
+    for pay_date in sorted(set(pay_dates)):
+        conn.execute("DELETE FROM summary WHERE Pay_date = ?", (pay_date,))
+        conn.execute(SUMMARY_ROLLUP_SQL.format(where="Pay_date = :pay_date"), {"pay_date": pay_date})
+
+
+# Migração 2: semana de pagamento em extras/back charges e summary como resumo materializado
+def _migration_2(conn):
+    conn.execute("ALTER TABLE extras ADD COLUMN Pay_date TEXT")
+    conn.execute("ALTER TABLE back_charges ADD COLUMN Pay_date TEXT")
+    conn.execute("ALTER TABLE summary ADD COLUMN Pay_date TEXT")
+    conn.execute("ALTER TABLE summary ADD COLUMN Jobs INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE summary ADD COLUMN Total_lucro REAL NOT NULL DEFAULT 0")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_extras_pay_date_installer ON extras (Pay_date, Installer)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_back_charges_pay_date_installer ON back_charges (Pay_date, Installer)"
+    )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_summary_pay_date_installer ON summary (Pay_date, Installer)")
+    refresh_summary(conn)
+
+
+# Escritório usado quando a linha não informa outro (dados anteriores à migração 3)
+DEFAULT_OFFICE = "ATLANTA"
+
+
+# Migração 3: escritório em serviços, extras e back charges, com índices para o Labor Bill
+def _migration_3(conn):
+    for table in ("fechamento_semanal", "extras", "back_charges"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN Office TEXT NOT NULL DEFAULT '{DEFAULT_OFFICE}'")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_office_pay_date_installer "
+            f"ON {table} (Office, Pay_date, Installer)"
+        )
+
+
+# Migração 4: impressão digital do conteúdo de cada serviço (sincronização incremental)
+def _migration_4(conn):
+    conn.execute("ALTER TABLE fechamento_semanal ADD COLUMN Row_hash TEXT")
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_fechamento_semanal_pay_date_installer_job
+    ON fechamento_semanal (Pay_date, Installer, Job_number)
+    """)
+    # O índice novo começa pelas mesmas colunas e atende às mesmas consultas
+    conn.execute("DROP INDEX IF EXISTS idx_fechamento_semanal_pay_date_installer")
+
+
+# Migração 5: trabalhos em segundo plano (relatórios, consolidação, gravações)
+def _migration_5(conn):
+    conn.execute("""
+    CREATE TABLE background_jobs (
+        Id TEXT PRIMARY KEY,
+        Kind TEXT NOT NULL,
+        Label TEXT NOT NULL,
+        Status TEXT NOT NULL,
+        Progress REAL NOT NULL DEFAULT 0,
+        Message TEXT NOT NULL DEFAULT '',
+        Result_json TEXT,
+        Result_digest TEXT,
+        Result_name TEXT,
+        Error TEXT,
+        Created_at TEXT NOT NULL,
+        Updated_at TEXT NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_background_jobs_kind_created ON background_jobs (Kind, Created_at)")
+
+
+# Lista ordenada de migrações: (versão, função). Nunca altere uma já publicada;
+# acrescente uma nova versão no final.
+MIGRATIONS = [
+    (1, _migration_1),
+    (2, _migration_2),
+    (3, _migration_3),
+    (4, _migration_4),
+    (5, _migration_5),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+# Função para atualizar o banco para a versão atual do esquema
+@timed("db.migrate")
+def migrate_database(conn=None):
+    """
+    Aplica, em ordem, as migrações com versão maior que PRAGMA user_version.
+    Cada migração roda em sua própria transação junto com a atualização do
+    user_version, então uma falha não deixa o banco pela metade. A versão é
+    lida de novo dentro de cada transação: se outro processo (CLI e app ao
+    mesmo tempo) já aplicou a migração, ela é pulada.
+    Retorna a versão final do esquema.
+    """
+    own_connection = conn is None
+    if own_connection:
+        conn = get_connection()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    _writer_lock.acquire()
+    try:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version > current:
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version = {version}")
+                    current = version
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return current
+    finally:
+        _writer_lock.release()
+        conn.isolation_level = isolation_level
+        if own_connection:
+            conn.close()
+
+
+# Função para criar tabelas (executa uma vez)
+def create_tables():
+    return migrate_database()
+
+
+_database_ready = False
+_database_lock = threading.Lock()
+
+
+# Função para inicializar o banco uma única vez por processo
+def ensure_database():
+    global _database_ready
+    if _database_ready:
+        return
+    with _database_lock:
+        if not _database_ready:
+            create_tables()
+            _database_ready = True
+
+
+# Função para inserir dados no banco
+def insert_data(table, data):
+    placeholders = ', '.join(['?'] * len(data))
+    with write_transaction() as conn:
+        conn.execute(f"INSERT INTO {table} VALUES (NULL, {placeholders})", tuple(data))
+
+
+# Função para consultar dados do banco
+@timed("db.query_data")
+def query_data(query, params=()):
+    conn = get_connection()
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+    return df
+
+# Colunas da tabela fechamento_semanal e a coluna correspondente no DataFrame
+WEEK_COLUMNS = [
+    ("installer", "installer"),
+    ("customer_name", "customer name"),
+    ("job_number", "job number"),
+    ("labor", "labor"),
+    ("expenses", "expenses"),
+    ("pay_date", "pay_date"),
+    ("job_date", "job_date"),
+    ("prices_after_percent", "prices_after_percent"),
+    ("discount", "discount"),
+    ("extras_details", "extras_details"),
+    ("back_charge", "back_charge"),
+    ("office", "office"),
+]
+NUMERIC_WEEK_COLUMNS = ["labor", "expenses", "prices_after_percent", "discount", "back_charge"]
+DATE_WEEK_COLUMNS = ["pay_date", "job_date"]
+OPTIONAL_WEEK_COLUMNS = {"extras_details": "", "office": DEFAULT_OFFICE}
+
+
+# Posições das colunas que identificam um serviço (job number, instalador, semana)
+WEEK_DB_COLUMNS = [db_col for db_col, _ in WEEK_COLUMNS]
+PAY_DATE_POSITION = WEEK_DB_COLUMNS.index("pay_date")
+KEY_POSITIONS = [WEEK_DB_COLUMNS.index(col) for col in ("job_number", "installer", "pay_date")]
+CONTENT_POSITIONS = [idx for idx in range(len(WEEK_COLUMNS)) if idx not in KEY_POSITIONS]
+
+INSERT_WEEK_SQL = (
+    f"INSERT INTO fechamento_semanal ({', '.join(WEEK_DB_COLUMNS)}, Row_hash) "
+    f"VALUES ({', '.join(['?'] * (len(WEEK_COLUMNS) + 1))})"
+)
+
+
+# Função para calcular o hash do conteúdo de uma linha (sem as colunas da chave)
+def row_hash(record):
+    content = [
+        round(record[idx], 6) if isinstance(record[idx], float) else record[idx] for idx in CONTENT_POSITIONS
+    ]
+    return hashlib.sha256(json.dumps(content, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+# Função para numerar as chaves repetidas (dois serviços com o mesmo job number na semana)
+def _keyed(rows, key):
+    seen = {}
+    keyed = {}
+    for row in rows:
+        base = key(row)
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+        keyed[base + (occurrence,)] = row
+    return keyed
+
+
+# Função para montar as linhas de uma semana a partir das colunas do DataFrame
+def week_records(data):
+    """
+    Converte o DataFrame da semana em uma lista de tuplas na ordem de
+    WEEK_COLUMNS, trabalhando coluna a coluna. Levanta ValueError se faltar
+    alguma coluna ou houver valores vazios/inválidos. Não altera data.
+    """
+    missing = [df_col for _, df_col in WEEK_COLUMNS if df_col not in data.columns
+               and df_col not in OPTIONAL_WEEK_COLUMNS]
+    if missing:
+        raise ValueError(f"Colunas ausentes: {', '.join(missing)}")
+
+    arrays = []
+    problems = []
+    for db_col, df_col in WEEK_COLUMNS:
+        if df_col not in data.columns:
+            arrays.append([OPTIONAL_WEEK_COLUMNS[df_col]] * len(data))
+            continue
+
+        column = data[df_col]
+        if df_col in NUMERIC_WEEK_COLUMNS:
+            column = pd.to_numeric(column, errors="coerce")
+        elif df_col in DATE_WEEK_COLUMNS:
+            column = pd.to_datetime(column, errors="coerce").dt.strftime('%Y-%m-%d')
+        elif df_col in OPTIONAL_WEEK_COLUMNS:
+            column = column.fillna(OPTIONAL_WEEK_COLUMNS[df_col]).astype(str)
+
+        invalid = column.isna()
+        if invalid.any():
+            problems.append(f"{df_col} ({int(invalid.sum())} linha(s))")
+            continue
+        if df_col in NUMERIC_WEEK_COLUMNS:
+            arrays.append(column.astype(float).tolist())
+        else:
+            arrays.append(column.astype(str).tolist())
+
+    if problems:
+        raise ValueError(f"Valores vazios ou inválidos em: {', '.join(problems)}")
+    return list(zip(*arrays))
+
+
+# Colunas de extras e back_charges na ordem das tuplas recebidas por
+# save_week() e sync_week(); a última é sempre Pay_date
+ADJUSTMENT_COLUMNS = {
+    "extras": ["Installer", "Extra_name", "Extra_value", "Extra_date", "Pay_date"],
+    "back_charges": ["Installer", "Back_charge", "Reason", "Pay_date"],
+}
+
+
+# Função para gravar uma semana inteira em uma única transação
+@timed("db.save_week")
+def save_week(data, dry_run=False, extras=None, back_charges=None):
+    """
+    Valida e grava todas as linhas da semana com um único executemany dentro
+    de uma transação: ou entram todas, ou nenhuma. Com dry_run=True apenas
+    valida e devolve quantas linhas seriam gravadas.
+
+    extras são tuplas (installer, nome, valor, data do extra, pay_date) e
+    back_charges tuplas (installer, valor, motivo, pay_date); entram na mesma
+    transação. O resumo (summary) das semanas afetadas é recalculado antes
+    do commit.
+    Retorna o número de linhas inseridas.
+    """
+    records = week_records(data)
+    if dry_run or not records:
+        count("db.rows_validated", len(records))
+        return len(records)
+
+    pay_dates = {record[PAY_DATE_POSITION] for record in records}
+    with write_transaction() as conn:
+        conn.executemany(INSERT_WEEK_SQL, [record + (row_hash(record),) for record in records])
+        for table, rows in (("extras", extras), ("back_charges", back_charges)):
+            if rows:
+                columns = ADJUSTMENT_COLUMNS[table]
+                conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})", rows
+                )
+        refresh_summary(conn, pay_dates)
+    count("db.rows_written", len(records))
+    return len(records)
+
+
+def _adjustment_row(row):
+    return tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+
+
+# Função para achar as (semana, instalador) cujos extras/back charges mudaram
+def _changed_adjustments(conn, table, adjustments):
+    """
+    adjustments é {(pay_date, installer): tuplas novas (ordem de
+    ADJUSTMENT_COLUMNS[table])}; cada par substitui por inteiro o que está
+    gravado. Retorna o mesmo formato só para os pares em que o que está
+    gravado é diferente.
+    """
+    incoming = {pair: [_adjustment_row(row) for row in rows] for pair, rows in adjustments.items()}
+
+    stored = {}
+    pay_dates = sorted({pay_date for pay_date, _ in incoming})
+    for start in range(0, len(pay_dates), 500):
+        chunk = pay_dates[start:start + 500]
+        for row in conn.execute(f"""
+        SELECT {', '.join(ADJUSTMENT_COLUMNS[table])}
+        FROM {table}
+        WHERE Pay_date IN ({', '.join(['?'] * len(chunk))})
+        """, chunk):
+            if (row[-1], row[0]) in incoming:
+                stored.setdefault((row[-1], row[0]), []).append(_adjustment_row(row))
+
+    return {
+        pair: new_rows for pair, new_rows in incoming.items()
+        if sorted(new_rows, key=repr) != sorted(stored.get(pair, []), key=repr)
+    }
+
+
+# Função para sincronizar as semanas da planilha com o banco (só o que mudou)
+@timed("db.sync_week")
+def sync_week(data, dry_run=False, extras=None, back_charges=None):
+    """
+    Compara as linhas de data com as já gravadas nas mesmas semanas
+    (pay_date) usando a chave job number + instalador + semana e o hash do
+    conteúdo, e então insere as novas, atualiza as alteradas e apaga as que
+    não estão mais na planilha, tudo em uma transação. Semanas fora de data
+    não são tocadas. Gravar a mesma planilha de novo não muda nada.
+
+    extras e back_charges são {(semana, instalador): tuplas como em
+    save_week}: só os pares presentes são substituídos (lista vazia apaga o
+    que estava gravado); os demais, e as tabelas passadas como None, não são
+    tocados.
+
+    Com dry_run=True só calcula as diferenças. Retorna um dicionário com as
+    quantidades (inserted, updated, deleted, unchanged, adjusted = pares
+    semana/instalador com extras ou back charges trocados) e 'changes', um
+    DataFrame com uma linha por diferença de serviço para pré-visualização.
+    """
+    records = week_records(data)
+    pay_dates = sorted({record[PAY_DATE_POSITION] for record in records})
+    incoming = _keyed(records, lambda record: tuple(record[idx] for idx in KEY_POSITIONS))
+
+    # Gravando, a comparação já acontece dentro da transação de escrita: outra
+    # gravação da mesma semana não muda as linhas entre a leitura e o UPDATE
+    with nullcontext(get_connection()) if dry_run else write_transaction() as conn:
+        stored_rows = []
+        for start in range(0, len(pay_dates), 500):
+            chunk = pay_dates[start:start + 500]
+            stored_rows += conn.execute(f"""
+            SELECT Id, Job_number, Installer, Pay_date, Row_hash
+            FROM fechamento_semanal
+            WHERE Pay_date IN ({', '.join(['?'] * len(chunk))})
+            ORDER BY Id
+            """, chunk).fetchall()
+        stored = _keyed(stored_rows, lambda row: (row[1], row[2], row[3]))
+
+        inserts = [record for key, record in incoming.items() if key not in stored]
+        updates = [
+            (stored[key][0], record) for key, record in incoming.items()
+            if key in stored and stored[key][4] != row_hash(record)
+        ]
+        deletes = [row[0] for key, row in stored.items() if key not in incoming]
+
+        changed_ids = [row_id for row_id, _ in updates] + deletes
+        previous = {}
+        for start in range(0, len(changed_ids), 500):
+            chunk = changed_ids[start:start + 500]
+            for row in conn.execute(f"""
+            SELECT Id, {', '.join(WEEK_DB_COLUMNS)}
+            FROM fechamento_semanal
+            WHERE Id IN ({', '.join(['?'] * len(chunk))})
+            """, chunk):
+                previous[row[0]] = tuple(row[1:])
+
+        adjustments = {
+            table: _changed_adjustments(conn, table, supplied)
+            for table, supplied in (("extras", extras), ("back_charges", back_charges)) if supplied
+        }
+        adjusted = {pair for changed in adjustments.values() for pair in changed}
+
+        if not dry_run and (inserts or updates or deletes or adjusted):
+            assignments = ", ".join(f"{col} = ?" for col in WEEK_DB_COLUMNS)
+            conn.executemany(INSERT_WEEK_SQL, [record + (row_hash(record),) for record in inserts])
+            conn.executemany(
+                f"UPDATE fechamento_semanal SET {assignments}, Row_hash = ? WHERE Id = ?",
+                [record + (row_hash(record), row_id) for row_id, record in updates],
+            )
+            conn.executemany("DELETE FROM fechamento_semanal WHERE Id = ?", [(row_id,) for row_id in deletes])
+            for table, changed in adjustments.items():
+                columns = ADJUSTMENT_COLUMNS[table]
+                conn.executemany(
+                    f"DELETE FROM {table} WHERE Pay_date = ? AND Installer = ?", list(changed)
+                )
+                conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+                    [row for rows in changed.values() for row in rows],
+                )
+            refresh_summary(conn, {record[PAY_DATE_POSITION] for record in inserts}
+                            | {record[PAY_DATE_POSITION] for _, record in updates}
+                            | {previous[row_id][PAY_DATE_POSITION] for row_id in deletes}
+                            | {pay_date for pay_date, _ in adjusted})
+            count("db.rows_written", len(inserts) + len(updates) + len(deletes))
+
+    changes = []
+    for record in inserts:
+        changes.append({"action": "inserir", **dict(zip(WEEK_DB_COLUMNS, record)), "changed": ""})
+    for row_id, record in updates:
+        old = previous.get(row_id)
+        changed = [
+            col for idx, col in enumerate(WEEK_DB_COLUMNS)
+            if old is None or str(old[idx]) != str(record[idx])
+        ]
+        changes.append({
+            "action": "atualizar", **dict(zip(WEEK_DB_COLUMNS, record)), "changed": ", ".join(changed) or "Row_hash",
+        })
+    for row_id in deletes:
+        changes.append({"action": "apagar", **dict(zip(WEEK_DB_COLUMNS, previous[row_id])), "changed": ""})
+
+    return {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(deletes),
+        "unchanged": len(incoming) - len(inserts) - len(updates),
+        "adjusted": len(adjusted),
+        "changes": pd.DataFrame(changes, columns=["action", *WEEK_DB_COLUMNS, "changed"]),
+    }
+
+
+# Função para consultar o resumo materializado por instalador e semana
+@timed("db.query_summary")
+def query_summary(start, end, installers=None):
+    """
+    Lê as linhas de summary com Pay_date entre start e end (texto ISO).
+    """
+    query = """
+    SELECT Pay_date, Installer, Jobs, Total_labor, Total_expenses, Total_extras,
+           Total_back_charges, Total_price, Total_lucro
+    FROM summary
+    WHERE Pay_date BETWEEN ? AND ?
+    """
+    params = [start, end]
+    if installers:
+        query += f" AND Installer IN ({', '.join(['?'] * len(installers))})"
+        params.extend(installers)
+    query += " ORDER BY Pay_date, Installer"
+    return query_data(query, params)
+
+
+# Função para totalizar o resumo por instalador ou por semana (GROUP BY no SQLite)
+@timed("db.query_summary_totals")
+def query_summary_totals(start, end, group_by="Installer"):
+    if group_by not in ("Installer", "Pay_date"):
+        raise ValueError(f"Agrupamento inválido: {group_by}")
+    return query_data(f"""
+    SELECT {group_by}, SUM(Jobs) AS Jobs, SUM(Total_labor) AS Total_labor,
+           SUM(Total_expenses) AS Total_expenses, SUM(Total_extras) AS Total_extras,
+           SUM(Total_back_charges) AS Total_back_charges, SUM(Total_price) AS Total_price,
+           SUM(Total_lucro) AS Total_lucro
+    FROM summary
+    WHERE Pay_date BETWEEN ? AND ?
+    GROUP BY {group_by}
+    ORDER BY {group_by}
+    """, (start, end))
+
+
+# Filtro comum das consultas do Labor Bill (usa os índices por Office/Pay_date/Installer)
+def _labor_bill_filter(start, end, office=None, installers=None):
+    where = "Pay_date BETWEEN :start AND :end"
+    params = {"start": start, "end": end}
+    if office:
+        where = "Office = :office AND " + where
+        params["office"] = office
+    if installers:
+        names = [f":installer_{idx}" for idx in range(len(installers))]
+        where += f" AND Installer IN ({', '.join(names)})"
+        params.update({name[1:]: installer for name, installer in zip(names, installers)})
+    return where, params
+
+
+# Ordem dos instaladores pelo número (PM2 antes de PM10), feita no SQLite
+INSTALLER_ORDER_SQL = "CAST(SUBSTR(Installer, 3) AS INTEGER), Installer"
+
+LABOR_BILL_JOB_COLUMNS = [
+    "Installer", "Pay_date", "Job_date", "Customer_name", "Job_number",
+    "Labor", "Expenses", "Prices_after_percent", "Back_charge",
+]
+
+
+# Função para listar os escritórios com serviços gravados
+@timed("db.query_offices")
+def query_offices():
+    return query_data("SELECT DISTINCT Office FROM fechamento_semanal ORDER BY Office")["Office"].tolist()
+
+
+# Função para listar os instaladores de um período (e escritório)
+@timed("db.query_labor_bill_installers")
+def query_labor_bill_installers(start, end, office=None):
+    where, params = _labor_bill_filter(start, end, office)
+    return query_data(
+        f"SELECT DISTINCT Installer FROM fechamento_semanal WHERE {where} ORDER BY {INSTALLER_ORDER_SQL}", params
+    )["Installer"].tolist()
+
+
+# Função para totalizar o Labor Bill por instalador (GROUP BY no SQLite)
+@timed("db.query_labor_bill_totals")
+def query_labor_bill_totals(start, end, office=None, installers=None):
+    """
+    Uma linha por instalador com serviços no período: quantidade, labor,
+    despesas, total após o percentual, extras, back charges e o total
+    devido (após % + extras - back charges).
+    """
+    where, params = _labor_bill_filter(start, end, office, installers)
+    return query_data(f"""
+    SELECT j.Installer, j.Jobs, j.Total_labor, j.Total_expenses, j.Total_after,
+           COALESCE(e.Total_extras, 0) AS Total_extras,
+           j.Row_back_charges + COALESCE(b.Total_back_charges, 0) AS Total_back_charges,
+           j.Total_after + COALESCE(e.Total_extras, 0)
+               - j.Row_back_charges - COALESCE(b.Total_back_charges, 0) AS Total_due
+    FROM (
+        SELECT Installer, COUNT(*) AS Jobs, SUM(Labor) AS Total_labor, SUM(Expenses) AS Total_expenses,
+               SUM(Prices_after_percent) AS Total_after, SUM(Back_charge) AS Row_back_charges
+        FROM fechamento_semanal
+        WHERE {where}
+        GROUP BY Installer
+    ) j
+    LEFT JOIN (
+        SELECT Installer, SUM(Extra_value) AS Total_extras
+        FROM extras
+        WHERE {where}
+        GROUP BY Installer
+    ) e ON e.Installer = j.Installer
+    LEFT JOIN (
+        SELECT Installer, SUM(Back_charge) AS Total_back_charges
+        FROM back_charges
+        WHERE {where}
+        GROUP BY Installer
+    ) b ON b.Installer = j.Installer
+    ORDER BY CAST(SUBSTR(j.Installer, 3) AS INTEGER), j.Installer
+    """, params)
+
+
+def _labor_bill_jobs_sql(where):
+    return f"""
+    SELECT {', '.join(LABOR_BILL_JOB_COLUMNS)}
+    FROM fechamento_semanal
+    WHERE {where}
+    ORDER BY {INSTALLER_ORDER_SQL}, Pay_date, Job_date, Id
+    """
+
+
+# Função para ler uma página dos serviços do Labor Bill
+@timed("db.query_labor_bill_jobs")
+def query_labor_bill_jobs(start, end, office=None, installers=None, limit=100, offset=0):
+    where, params = _labor_bill_filter(start, end, office, installers)
+    params.update({"limit": int(limit), "offset": int(offset)})
+    return query_data(_labor_bill_jobs_sql(where) + " LIMIT :limit OFFSET :offset", params)
+
+
+# Função para percorrer todos os serviços do Labor Bill em lotes
+def iter_labor_bill_jobs(start, end, office=None, installers=None, batch_size=500):
+    """
+    Gera tuplas na ordem de LABOR_BILL_JOB_COLUMNS, lendo do cursor em lotes
+    de batch_size (sem carregar o Labor Bill inteiro na memória).
+    """
+    where, params = _labor_bill_filter(start, end, office, installers)
+    conn = get_connection()
+    try:
+        cursor = conn.execute(_labor_bill_jobs_sql(where), params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            count("db.labor_bill_rows", len(rows))
+            yield from rows
+    finally:
+        conn.close()
+
+
+# Função para listar os extras e back charges do Labor Bill
+@timed("db.query_labor_bill_adjustments")
+def query_labor_bill_adjustments(start, end, office=None, installers=None):
+    """
+    Extras (valor positivo) e back charges (valor negativo) do período,
+    com Installer, Pay_date, Kind, Description e Value.
+    """
+    where, params = _labor_bill_filter(start, end, office, installers)
+    return query_data(f"""
+    SELECT * FROM (
+        SELECT Installer, Pay_date, 'Extra' AS Kind, Extra_name AS Description, Extra_value AS Value
+        FROM extras
+        WHERE {where}
+        UNION ALL
+        SELECT Installer, Pay_date, 'Back charge' AS Kind, COALESCE(Reason, '') AS Description,
+               -Back_charge AS Value
+        FROM back_charges
+        WHERE {where}
+    )
+    ORDER BY {INSTALLER_ORDER_SQL}, Pay_date, Kind
+    """, params)
+
+
+# Função para salvar os dados no banco
+def save_to_database(data):
+    return save_week(data)
+
+
+# Função para buscar a extração de um PDF já processado
+@timed("db.get_cached_extraction")
+def get_cached_extraction(pdf_digest, extractor_version):
+    """
+    Procura as tabelas extraídas de um PDF pelo SHA-256 dos bytes e pela
+    versão do extrator. Retorna (labor_df, total_after_df, total_labor,
+    total_after) ou None quando não há registro (ou a tabela ainda não existe).
+    """
+    try:
+        conn = get_connection()
+        try:
+            row = conn.execute("""
+            SELECT Labor_table, Total_after_table, Total_labor, Total_after
+            FROM pdf_extraction_cache
+            WHERE Pdf_digest = ? AND Extractor_version = ?
+            """, (pdf_digest, extractor_version)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+    if row is None:
+        return None
+    labor_df = pd.read_json(io.StringIO(row[0]), orient="split", dtype=False, convert_dates=False)
+    total_after_df = pd.read_json(io.StringIO(row[1]), orient="split", dtype=False, convert_dates=False)
+    return labor_df, total_after_df, row[2], row[3]
+
+
+# Função para guardar a extração de um PDF
+@timed("db.store_extraction")
+def store_extraction(pdf_digest, extractor_version, labor_df, total_after_df, total_labor, total_after):
+    """
+    Grava (ou substitui) a extração de um PDF no cache. Falhas de escrita
+    são ignoradas: o cache é só uma otimização.
+    """
+    try:
+        with write_transaction() as conn:
+            conn.execute("""
+            INSERT OR REPLACE INTO pdf_extraction_cache (
+                Pdf_digest, Extractor_version, Labor_table, Total_after_table,
+                Total_labor, Total_after, Created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                pdf_digest, extractor_version,
+                labor_df.to_json(orient="split", index=False),
+                total_after_df.to_json(orient="split", index=False),
+                total_labor, total_after, datetime.now().isoformat(timespec="seconds")
+            ))
+    except sqlite3.Error:
+        pass
+
+
+# Colunas de background_jobs que podem ser atualizadas por update_job()
+JOB_COLUMNS = [
+    "Status", "Progress", "Message", "Result_json", "Result_digest", "Result_name", "Error",
+]
+
+
+def _job_dict(row, columns):
+    job = dict(zip((col.lower() for col in columns), row))
+    job["result"] = json.loads(job.pop("result_json")) if job.get("result_json") else None
+    return job
+
+
+# Função para registrar um trabalho novo (status 'queued')
+def create_job(job_id, kind, label):
+    now = datetime.now().isoformat(timespec="seconds")
+    with write_transaction() as conn:
+        conn.execute("""
+        INSERT INTO background_jobs (Id, Kind, Label, Status, Created_at, Updated_at)
+        VALUES (?, ?, ?, 'queued', ?, ?)
+        """, (job_id, kind, label, now, now))
+
+
+# Função para atualizar o estado de um trabalho
+def update_job(job_id, **fields):
+    """
+    fields usa os nomes de JOB_COLUMNS em minúsculas; 'result' é gravado
+    como JSON em Result_json.
+    """
+    if "result" in fields:
+        fields["result_json"] = json.dumps(fields.pop("result"), default=str)
+    columns = [col for col in JOB_COLUMNS if col.lower() in fields]
+    values = [fields[col.lower()] for col in columns]
+    with write_transaction() as conn:
+        conn.execute(
+            f"UPDATE background_jobs SET {', '.join(f'{col} = ?' for col in columns)}, Updated_at = ? "
+            f"WHERE Id = ?",
+            values + [datetime.now().isoformat(timespec="seconds"), job_id],
+        )
+
+
+JOB_SELECT_COLUMNS = ["Id", "Kind", "Label", "Created_at", "Updated_at"] + JOB_COLUMNS
+
+
+# Função para ler um trabalho pelo ID (None se não existir)
+def query_job(job_id):
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            f"SELECT {', '.join(JOB_SELECT_COLUMNS)} FROM background_jobs WHERE Id = ?", (job_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return None if row is None else _job_dict(row, JOB_SELECT_COLUMNS)
+
+
+# Função para listar os trabalhos mais recentes (de alguns tipos)
+def query_jobs(kinds=None, limit=20):
+    query = f"SELECT {', '.join(JOB_SELECT_COLUMNS)} FROM background_jobs"
+    params = []
+    if kinds:
+        query += f" WHERE Kind IN ({', '.join(['?'] * len(kinds))})"
+        params.extend(kinds)
+    query += " ORDER BY Created_at DESC, rowid DESC LIMIT ?"
+    params.append(int(limit))
+    conn = get_connection()
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+    return [_job_dict(row, JOB_SELECT_COLUMNS) for row in rows]
+
+
+# Função para marcar como interrompidos os trabalhos de um processo que já terminou
+def interrupt_unfinished_jobs():
+    with write_transaction() as conn:
+        return conn.execute("""
+        UPDATE background_jobs
+        SET Status = 'interrupted', Error = 'Servidor reiniciado antes do fim do trabalho.', Updated_at = ?
+        WHERE Status IN ('queued', 'running')
+        """, (datetime.now().isoformat(timespec="seconds"),)).rowcount
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+
+
+# Diagnóstico de desempenho: spans de tempo e contadores por execução do script.
+# Desligado, span() devolve um objeto vazio compartilhado e timed() chama a
+# função direto, sem medir nada.
+ENV_FLAG = "PMHRS_DIAGNOSTICS"
+
+logger = logging.getLogger("diagnostics")
+
+_state = threading.local()
+
+
+def enabled_by_environment():
+    return os.environ.get(ENV_FLAG, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("run", "name", "fields", "started")
+
+    def __init__(self, run, name, fields):
+        self.run = run
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        record = {"span": self.name, "seconds": round(seconds, 6), **self.fields}
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        self.run["spans"].append(record)
+        logger.info(json.dumps({"event": "span", "run": self.run["run"], **record}, default=str))
+        return False
+
+
+# Função para começar a medir uma execução (uma por rerun do Streamlit)
+def start_run(label, **fields):
+    """
+    Abre a coleta desta thread. Sem start_run(), span(), count() e timed()
+    não fazem nada.
+    """
+    _state.run = {
+        "run": f"{label}-{time.time_ns():x}",
+        "label": label,
+        "started": time.perf_counter(),
+        "spans": [],
+        "counters": {},
+        **fields,
+    }
+    return _state.run
+
+
+# Função para encerrar a execução e registrar o resumo em JSON
+def finish_run():
+    run = getattr(_state, "run", None)
+    if run is None:
+        return None
+    _state.run = None
+    run["seconds"] = round(time.perf_counter() - run.pop("started"), 6)
+
+    totals = {}
+    for record in run["spans"]:
+        totals[record["span"]] = totals.get(record["span"], 0.0) + record["seconds"]
+    run["totals"] = {name: round(seconds, 6) for name, seconds in totals.items()}
+    logger.info(json.dumps({"event": "run", **{k: v for k, v in run.items() if k != "spans"}}, default=str))
+    return run
+
+
+def active():
+    return getattr(_state, "run", None) is not None
+
+
+# Função para medir um trecho: with span("pdf.render", installer="PM2"): ...
+def span(name, **fields):
+    run = getattr(_state, "run", None)
+    if run is None:
+        return _NOOP
+    return _Span(run, name, fields)
+
+
+# Função para somar um contador (linhas, bytes, arquivos...)
+def count(name, value=1):
+    run = getattr(_state, "run", None)
+    if run is not None:
+        run["counters"][name] = run["counters"].get(name, 0) + value
+
+
+# Decorador para medir todas as chamadas de uma função
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run = getattr(_state, "run", None)
+            if run is None:
+                return func(*args, **kwargs)
+            with _Span(run, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
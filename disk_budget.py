@@ -0,0 +1,64 @@
+import os
+import threading
+
+
+# Pasta de cache com tamanho máximo em disco. O total é mantido a cada
+# gravação: a pasta só é percorrida na primeira gravação do processo e quando
+# o total passa do limite, e aí as entradas de uso mais antigo (mtime) saem
+# até sobrar trim_target. Arquivos .tmp (gravações em andamento) não contam.
+class DiskBudget:
+    def __init__(self, directory, max_bytes, trim_target, is_stale=None):
+        """
+        is_stale(name), se dado, marca arquivos que devem ser apagados sempre
+        que a pasta é percorrida (por exemplo, de versões antigas).
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.trim_target = trim_target
+        self.is_stale = is_stale
+        self._bytes = None
+        self._lock = threading.Lock()
+
+    def trim(self):
+        """
+        Apaga os arquivos vencidos e, se o total passar de max_bytes, os mais
+        antigos até sobrar trim_target. Retorna o total que ficou em disco.
+        """
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if self.is_stale is not None and self.is_stale(name):
+                        os.remove(path)
+                        continue
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return total
+        for _, size, path in sorted(entries):
+            if total <= self.trim_target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+    # Função para somar um arquivo novo ao total (percorre a pasta só ao passar do limite)
+    def add(self, size):
+        with self._lock:
+            if self._bytes is None:
+                # O primeiro levantamento já inclui o arquivo recém-gravado
+                self._bytes = self.trim()
+                return
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._bytes = self.trim()
@@ -0,0 +1,219 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import diagnostics
+from blob_store import add_reference, get_blob, has_blob, put_blob
+from database import (
+    create_job, ensure_database, interrupt_unfinished_jobs, query_job, query_jobs, update_job
+)
+
+
+# Trabalhos longos (consolidação, ZIP de relatórios, gravações no banco) rodam
+# em threads do processo do servidor, fora da thread do script: continuam se o
+# usuário trocar de página ou a conexão cair. Estado e resultado ficam no banco
+# (background_jobs) e os bytes no blob_store, para qualquer sessão buscar depois.
+MAX_JOB_WORKERS = 2
+PROGRESS_INTERVAL_SECONDS = 0.5
+RESULTS_SESSION = "background-jobs"
+FINISHED_STATUSES = ("done", "error", "interrupted")
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_live = {}
+
+
+def _get_executor():
+    global _executor
+    if _executor is not None:
+        return _executor
+    with _executor_lock:
+        if _executor is None:
+            ensure_database()
+            # Trabalhos 'running' de um processo anterior nunca vão terminar
+            interrupted = interrupt_unfinished_jobs()
+            if interrupted:
+                logger.warning("%d trabalho(s) interrompido(s) por reinício do servidor", interrupted)
+            _executor = ThreadPoolExecutor(max_workers=MAX_JOB_WORKERS, thread_name_prefix="pmhrs-job")
+    return _executor
+
+
+class JobContext:
+    """
+    Passado para a tarefa: progress() guarda o andamento em memória (lido na
+    hora pelas sessões deste processo) e no banco, no máximo a cada
+    PROGRESS_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._saved_at = 0.0
+
+    def progress(self, fraction, message=""):
+        fraction = min(max(float(fraction), 0.0), 1.0)
+        _live[self.job_id] = (fraction, message)
+        now = time.monotonic()
+        if now - self._saved_at >= PROGRESS_INTERVAL_SECONDS or fraction >= 1.0:
+            self._saved_at = now
+            update_job(self.job_id, progress=fraction, message=message)
+
+
+def _run(job_id, kind, diagnose, task, args, kwargs):
+    context = JobContext(job_id)
+    update_job(job_id, status="running")
+    # A thread do trabalho tem a própria coleta: o JSON da execução sai no log
+    # ao terminar e os tempos por etapa vão junto com o resultado
+    if diagnose:
+        diagnostics.start_run(f"job-{kind}", job=job_id)
+    try:
+        outcome = task(context, *args, **kwargs) or {}
+        run = diagnostics.finish_run()
+        summary = outcome.get("summary")
+        if run is not None and isinstance(summary, dict):
+            summary["diagnostics"] = {key: run[key] for key in ("run", "seconds", "totals", "counters")}
+        fields = {"status": "done", "progress": 1.0, "message": "Concluído", "result": summary}
+        if outcome.get("data") is not None:
+            digest = put_blob(outcome["data"])
+            add_reference(RESULTS_SESSION, digest)
+            fields.update(result_digest=digest, result_name=outcome.get("name"))
+        update_job(job_id, **fields)
+    except Exception as e:
+        logger.exception("Trabalho %s falhou", job_id)
+        update_job(job_id, status="error", error=f"{type(e).__name__}: {e}")
+    finally:
+        diagnostics.finish_run()
+        _live.pop(job_id, None)
+
+
+# Função para enfileirar um trabalho em segundo plano
+def submit_job(kind, label, task, *args, **kwargs):
+    """
+    task(context, *args, **kwargs) roda em uma thread do pool e devolve um
+    dicionário com 'summary' (serializável em JSON) e, opcionalmente,
+    'data' (bytes do resultado) e 'name' (nome do arquivo).
+    Retorna o ID do trabalho. Com o diagnóstico ligado (na execução que
+    enfileirou ou por PMHRS_DIAGNOSTICS), o trabalho mede as próprias etapas.
+    """
+    executor = _get_executor()
+    job_id = uuid.uuid4().hex
+    create_job(job_id, kind, label)
+    diagnose = diagnostics.active() or diagnostics.enabled_by_environment()
+    executor.submit(_run, job_id, kind, diagnose, task, args, kwargs)
+    return job_id
+
+
+# Função para ler o estado de um trabalho (com o andamento mais recente em memória)
+def get_job(job_id):
+    job = query_job(job_id)
+    if job is not None and job_id in _live and job["status"] not in FINISHED_STATUSES:
+        job["progress"], job["message"] = _live[job_id]
+    return job
+
+
+def list_jobs(kinds=None, limit=20):
+    return query_jobs(kinds, limit)
+
+
+# Função para buscar os bytes do resultado (renova a referência no blob_store)
+def job_result(job):
+    digest = job.get("result_digest")
+    if not digest or not has_blob(digest):
+        return None
+    add_reference(RESULTS_SESSION, digest)
+    return get_blob(digest)
+
+
+# Tarefa: consolidar os PDFs dos instaladores e gerar o relatório geral
+def consolidation_task(context, pdf_files):
+    from consolidation import consolidate_pdfs
+    from reports import render_consolidated_report
+
+    total_files = len(pdf_files)
+    context.progress(0.0, f"Processando {total_files} arquivo(s)")
+
+    def on_progress(done, total, result):
+        context.progress(done / total * 0.95, f"Processado {done}/{total}: {result['name']}")
+
+    with diagnostics.span("pdf.extract", files=total_files):
+        results = consolidate_pdfs(pdf_files, on_progress=on_progress)
+    diagnostics.count("pdf.files", len(results))
+    diagnostics.count("pdf.bytes_extracted", sum(pdf_file["size"] for pdf_file in pdf_files))
+
+    report_rows, errors = [], []
+    for result in results:
+        if result["error"]:
+            errors.append({"name": result["name"], "error": result["error"]})
+            continue
+        # Pegue os 3 primeiros caracteres do nome do arquivo
+        report_rows.append([result["name"][:3], result["labor"], result["total_after"], result["lucro"]])
+
+    total_labor = sum(row[1] for row in report_rows)
+    total_after = sum(row[2] for row in report_rows)
+    total_lucro = sum(row[3] for row in report_rows)
+    context.progress(0.97, "Gerando o PDF consolidado")
+    with diagnostics.span("pdf.render_consolidated", rows=len(report_rows)):
+        pdf_output = render_consolidated_report(report_rows, total_labor, total_after, total_lucro)
+    diagnostics.count("pdf.bytes_rendered", len(pdf_output))
+    return {
+        "data": pdf_output,
+        "name": f"Relatorio_Semanal_{time.strftime('%d_%m_%Y')}.pdf",
+        "summary": {
+            "rows": report_rows, "errors": errors,
+            "total_labor": total_labor, "total_after": total_after, "total_lucro": total_lucro,
+        },
+    }
+
+
+# Tarefa: renderizar os relatórios dos instaladores em um ZIP
+def reports_zip_task(context, reports, file_name):
+    from reports import render_reports_zip
+
+    context.progress(0.0, f"Gerando {len(reports)} relatório(s)")
+    with diagnostics.span("pdf.render_zip", reports=len(reports)):
+        bundle = render_reports_zip(
+            reports, on_progress=lambda done, total: context.progress(done / total, f"Relatório {done}/{total}")
+        )
+    diagnostics.count("pdf.bytes_rendered", len(bundle))
+    return {"data": bundle, "name": file_name, "summary": {"reports": sorted(reports)}}
+
+
+# Tarefa: sincronizar a semana (com extras e back charges) e atualizar o arquivo Parquet
+def save_week_task(context, data, extras=None, back_charges=None):
+    from archive import archive_week
+    from database import sync_week
+
+    context.progress(0.1, f"Sincronizando {len(data)} linha(s)")
+    diff = sync_week(data, extras=extras, back_charges=back_charges)
+    context.progress(0.8, "Atualizando o arquivo histórico")
+    with diagnostics.span("archive.write", rows=len(data)):
+        archive_week(data)
+    return {"summary": {key: value for key, value in diff.items() if key != "changes"}}
+
+
+# Tarefa: fechar as semanas de um intervalo e entregar os PDFs em um único ZIP
+def batch_closing_task(context, workbook_df, start, end, save):
+    import io
+    import os
+    import tempfile
+    import zipfile
+    from pipeline import close_weeks
+
+    context.progress(0.0, f"Fechando as semanas de {start} a {end}")
+    with tempfile.TemporaryDirectory() as output_dir:
+        with diagnostics.span("pipeline.close_weeks"):
+            result = close_weeks(workbook_df, start, end, output_dir, save=save)
+        context.progress(0.9, "Gerando o ZIP")
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for week in result["weeks"]:
+                for path in week.pop("files"):
+                    bundle.write(path, os.path.join(week["pay_date"], os.path.basename(path)))
+    return {
+        "data": buffer.getvalue() if result["weeks"] else None,
+        "name": f"Reports_{result['start']}_{result['end']}.zip",
+        "summary": result,
+    }
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+
+# Percentual descontado de cada equipe (PM) sobre labor - despesas
+TEAM_DISCOUNTS = {
+    "PM2": 0.30,
+    "PM3": 0.20,
+    "PM4": 0.20,
+    "PM5": 0.20,
+    "PM6": 0.30,
+    "PM7": 0.20,
+    "PM8": 0.20,
+}
+
+
+# Função para padronizar os códigos de instalador ("2", "pm 2" -> "PM2")
+def normalize_installers(series):
+    digits = series.astype(str).str.extract(r'(\d+)', expand=False).fillna("0")
+    return "PM" + digits
+
+
+# Função para ordenar instaladores pelo número (PM2 antes de PM10)
+def sort_installers(installers):
+    return sorted(installers, key=lambda x: int(x[2:]))
+
+
+# Função para aplicar o desconto da equipe em cada serviço
+def apply_discounts(df, team_discounts):
+    """
+    Calcula, coluna a coluna, 'discount' e 'prices after %' de cada serviço:
+    (labor - despesas) * (1 - discount) + despesas. Valores negativos ou
+    vazios de labor/despesas viram 0. Não altera o DataFrame recebido.
+    """
+    jobs = df.copy()
+    labor = np.clip(pd.to_numeric(jobs["labor"], errors="coerce").fillna(0.0).to_numpy(dtype=float), 0.0, None)
+    if "despesas" in jobs.columns:
+        despesas = pd.to_numeric(jobs["despesas"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+        despesas = np.clip(despesas, 0.0, None)
+    else:
+        despesas = np.zeros(len(jobs))
+    discount = jobs["installer"].map(team_discounts).fillna(0.0).to_numpy(dtype=float)
+
+    jobs["labor"] = labor
+    jobs["despesas"] = despesas
+    jobs["discount"] = discount
+    jobs["prices after %"] = (labor - despesas) * (1.0 - discount) + despesas
+    return jobs
+
+
+# Função principal de cálculo dos pagamentos da semana
+def compute_payouts(df, team_discounts, extras_data=None, back_charges=None):
+    """
+    Calcula os pagamentos de todos os instaladores de uma vez.
+
+    df precisa das colunas 'installer' (já no formato PMn) e 'labor';
+    'despesas' é opcional. extras_data é {installer: [{"value": ...}, ...]} e
+    back_charges é {installer: valor}.
+
+    Retorna (jobs, summary): jobs é o df com 'discount' e 'prices after %';
+    summary tem uma linha por instalador (ordenada por número) com
+    jobs, total_labor, total_despesas, total_prices_after_percent, discount,
+    extra_total, back_charge e final_total.
+    """
+    extras_data = extras_data or {}
+    back_charges = back_charges or {}
+
+    jobs = apply_discounts(df, team_discounts)
+    summary = jobs.groupby("installer", sort=False).agg(
+        jobs=("labor", "size"),
+        total_labor=("labor", "sum"),
+        total_despesas=("despesas", "sum"),
+        total_prices_after_percent=("prices after %", "sum"),
+    )
+    summary = summary.reindex(sort_installers(summary.index))
+
+    extra_totals = pd.Series(
+        {installer: sum(extra["value"] for extra in extras) for installer, extras in extras_data.items()},
+        dtype=float,
+    )
+    summary["discount"] = summary.index.map(team_discounts).fillna(0.0).astype(float)
+    summary["extra_total"] = extra_totals.reindex(summary.index, fill_value=0.0)
+    summary["back_charge"] = pd.Series(back_charges, dtype=float).reindex(summary.index, fill_value=0.0)
+    summary["final_total"] = (
+        summary["total_prices_after_percent"] + summary["extra_total"] - summary["back_charge"]
+    )
+    return jobs, summary
+
+
+# Função para calcular os pagamentos de várias semanas de uma só vez
+def compute_weekly_payouts(df, team_discounts, extras_data=None, back_charges=None):
+    """
+    Igual a compute_payouts(), mas para várias semanas: df precisa também
+    da coluna 'pay date'. Os descontos são aplicados uma vez em todas as
+    linhas e o resumo sai de um único groupby por (pay_week, installer).
+
+    extras_data é {(pay_week, installer): [{"value": ...}, ...]} e
+    back_charges é {(pay_week, installer): valor}, com pay_week no formato
+    'AAAA-MM-DD'.
+
+    Retorna (jobs, summary): jobs ganha a coluna 'pay_week'; summary é
+    indexado por (pay_week, installer), semanas em ordem e instaladores
+    ordenados por número dentro de cada semana.
+    """
+    extras_data = extras_data or {}
+    back_charges = back_charges or {}
+
+    jobs = apply_discounts(df, team_discounts)
+    jobs["pay_week"] = pd.to_datetime(jobs["pay date"], errors="coerce").dt.strftime('%Y-%m-%d')
+    summary = jobs.groupby(["pay_week", "installer"], sort=False).agg(
+        jobs=("labor", "size"),
+        total_labor=("labor", "sum"),
+        total_despesas=("despesas", "sum"),
+        total_prices_after_percent=("prices after %", "sum"),
+    )
+    summary = summary.reindex(sorted(summary.index, key=lambda key: (key[0], int(key[1][2:]))))
+
+    installers = summary.index.get_level_values("installer")
+    extra_totals = pd.Series(
+        {key: sum(extra["value"] for extra in extras) for key, extras in extras_data.items()}, dtype=float
+    )
+    summary["discount"] = installers.map(team_discounts).fillna(0.0).astype(float)
+    summary["extra_total"] = extra_totals.reindex(summary.index, fill_value=0.0) if extras_data else 0.0
+    summary["back_charge"] = (
+        pd.Series(back_charges, dtype=float).reindex(summary.index, fill_value=0.0) if back_charges else 0.0
+    )
+    summary["final_total"] = (
+        summary["total_prices_after_percent"] + summary["extra_total"] - summary["back_charge"]
+    )
+    return jobs, summary
@@ -0,0 +1,69 @@
+import io
+
+import pdfplumber
+import pandas as pd
+
+
+# Colunas lidas dos relatórios de instaladores
+LABOR_COLUMN = "Labor"
+TOTAL_AFTER_COLUMN = "TOTAL after %"
+REPORT_COLUMNS = (LABOR_COLUMN, TOTAL_AFTER_COLUMN)
+
+# Incrementar sempre que a lógica de extração mudar (invalida o cache no banco)
+EXTRACTOR_VERSION = 1
+
+
+# Função para converter textos monetários ("$1,234.50") em números
+def money_to_float(series):
+    cleaned = series.astype(str).str.replace(r"[$,\s]", "", regex=True)
+    return pd.to_numeric(cleaned, errors="coerce").astype(float)
+
+
+def _typed_table(table, column_name):
+    df = pd.DataFrame(table[1:], columns=table[0])
+    df[column_name] = money_to_float(df[column_name])
+    return df
+
+
+# Função para extrair várias tabelas do PDF em uma única leitura
+def extract_tables(pdf_data, column_names=REPORT_COLUMNS):
+    """
+    Abre o PDF uma única vez e percorre as páginas procurando, para cada nome
+    em column_names, a primeira tabela cujo cabeçalho contém essa coluna.
+    Para assim que todas forem encontradas. A coluna procurada já volta
+    convertida para float.
+
+    Retorna um dicionário {coluna: DataFrame}; colunas não encontradas ficam
+    de fora. Erros de leitura do PDF são propagados.
+    """
+    pending = list(dict.fromkeys(column_names))
+    found = {}
+    with pdfplumber.open(io.BytesIO(pdf_data)) as pdf:
+        for page in pdf.pages:
+            for table in page.extract_tables():
+                if not table:
+                    continue
+                header = table[0]
+                for column_name in [name for name in pending if name in header]:
+                    found[column_name] = _typed_table(table, column_name)
+                    pending.remove(column_name)
+            page.close()
+            if not pending:
+                break
+    return found
+
+
+# Função para calcular o lucro a partir dos totais
+def compute_lucro(total_labor, total_after, is_pm0=False):
+    return total_after if is_pm0 else total_labor - total_after
+
+
+# Função para somar as colunas e calcular o lucro
+def sum_totals(labor_df, total_after_df, is_pm0=False):
+    """
+    Soma 'Labor' e 'TOTAL after %' (já numéricas) e calcula o lucro.
+    Se o arquivo for 'PM0', o lucro é igual ao TOTAL after %.
+    """
+    total_labor = float(labor_df[LABOR_COLUMN].sum())
+    total_after = float(total_after_df[TOTAL_AFTER_COLUMN].sum())
+    return total_labor, total_after, compute_lucro(total_labor, total_after, is_pm0)
@@ -0,0 +1,217 @@
+import os
+
+import pandas as pd
+
+from archive import archive_week
+from database import sync_week
+from payouts import TEAM_DISCOUNTS, compute_payouts, compute_weekly_payouts, normalize_installers
+from pdf_extract import compute_lucro
+from reports import build_installer_report, render_consolidated_report, render_report, report_file_name
+
+
+REQUIRED_COLUMNS = ["installer", "pay date", "labor", "customer name", "job number", "when the job was done"]
+
+
+# Função para separar os serviços de um intervalo de semanas de pagamento
+def prepare_weeks(workbook_df, start, end):
+    """
+    Recebe a planilha canônica (read_payroll_workbook) e devolve, em um
+    único filtro, as linhas com 'pay date' entre start e end (inclusive),
+    com os instaladores no formato PMn e a coluna 'despesas' garantida
+    (planilhas só com 'expenses' usam essa coluna; sem nenhuma das duas, 0).
+    Levanta ValueError se faltar coluna.
+    """
+    df = workbook_df.rename(columns={"date": "when the job was done"})
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+    pay_dates = pd.to_datetime(df["pay date"], errors="coerce").dt.normalize()
+    in_range = pay_dates.between(pd.Timestamp(start), pd.Timestamp(end))
+    weeks = df[in_range].copy()
+    weeks["pay date"] = pay_dates[in_range]
+    weeks["installer"] = normalize_installers(weeks["installer"])
+    if "despesas" not in weeks.columns:
+        weeks["despesas"] = weeks["expenses"] if "expenses" in weeks.columns else 0.0
+    return weeks
+
+
+# Função para separar os serviços de uma semana de pagamento
+def prepare_week(workbook_df, pay_date):
+    return prepare_weeks(workbook_df, pay_date, pay_date)
+
+
+# Função para montar as linhas do banco a partir dos pagamentos calculados
+def week_database_frame(jobs, pay_date=None):
+    """
+    Sem pay_date, cada linha usa a própria 'pay date' (fechamento em lote).
+    """
+    return pd.DataFrame({
+        "installer": jobs["installer"],
+        "customer name": jobs["customer name"],
+        "job number": jobs["job number"],
+        "labor": jobs["labor"],
+        "expenses": jobs["despesas"],
+        "pay_date": pd.Timestamp(pay_date) if pay_date is not None else pd.to_datetime(jobs["pay date"]),
+        "job_date": pd.to_datetime(jobs["when the job was done"], errors="coerce"),
+        "prices_after_percent": jobs["prices after %"],
+        "discount": jobs["discount"],
+        "back_charge": 0.0,
+    })
+
+
+# Função para montar os extras e back charges no formato aceito por sync_week()
+def adjustment_rows(extras_data, back_charges):
+    """
+    extras_data e back_charges são chaveados por (pay_week, installer), com
+    pay_week no formato 'AAAA-MM-DD'. Só os pares informados entram (e são
+    substituídos no banco); back charge zerado apaga o que estava gravado.
+    Retorna (extras, back_charges), ambos {(pay_week, installer): tuplas}.
+    """
+    extras = {
+        (period, installer): [
+            (installer, extra["name"], extra["value"], pd.Timestamp(extra["date"]).strftime('%Y-%m-%d'), period)
+            for extra in week_extras
+        ]
+        for (period, installer), week_extras in extras_data.items()
+    }
+    charges = {
+        (period, installer): [(installer, value, f"Fechamento {period}", period)] if value > 0 else []
+        for (period, installer), value in back_charges.items()
+    }
+    return extras, charges
+
+
+# Função para calcular as linhas do banco de uma semana com as edições da tela
+def week_rows(workbook_df, pay_date, edits=None, extras_data=None, back_charges=None):
+    """
+    Mesmo caminho do fechamento pelo CLI: prepare_week (instaladores
+    normalizados), compute_payouts (descontos das equipes) e
+    week_database_frame. edits é um DataFrame indexado como a planilha com
+    'labor' e/ou 'despesas' editados (vazios mantêm o valor da planilha);
+    extras_data e back_charges são chaveados só pelo instalador e trazem
+    apenas os instaladores editados: os demais mantêm o que está gravado.
+    Retorna (linhas, extras, back_charges) prontas para sync_week().
+    """
+    period = pd.Timestamp(pay_date).strftime('%Y-%m-%d')
+    week = prepare_week(workbook_df, period)
+    if edits is not None and not edits.empty:
+        # A mesma linha editada em mais de um lugar: vale a última edição
+        edits = edits[[col for col in ("labor", "despesas") if col in edits.columns]].groupby(level=0).last()
+        week.update(edits)
+
+    extras_data = extras_data or {}
+    back_charges = back_charges or {}
+    jobs, _ = compute_payouts(week, TEAM_DISCOUNTS, extras_data, back_charges)
+    extras, charges = adjustment_rows(
+        {(period, installer): extras for installer, extras in extras_data.items()},
+        {(period, installer): value for installer, value in back_charges.items()},
+    )
+    return week_database_frame(jobs, period), extras, charges
+
+
+# Função para fechar várias semanas de pagamento em uma passada
+def close_weeks(workbook_df, start, end, output_dir, save=True, extras_data=None, back_charges=None):
+    """
+    Fecha todas as semanas com 'pay date' entre start e end: a planilha é
+    filtrada uma vez, os pagamentos saem de um único cálculo agrupado por
+    (semana, instalador) e, se save=True, as semanas são sincronizadas com
+    o banco em uma única transação (sync_week: fechar de novo a mesma
+    planilha não duplica nada, e os extras e back charges de cada semana e
+    instalador informados em extras_data e back_charges são substituídos;
+    os demais ficam como estão). Em output_dir ficam um PDF por instalador
+    e semana e um relatório consolidado por semana.
+
+    extras_data e back_charges são chaveados por (pay_week, installer),
+    com pay_week no formato 'AAAA-MM-DD'.
+
+    Retorna um dicionário serializável em JSON com um resumo por semana;
+    rows_saved conta as linhas inseridas ou alteradas e 'sync' traz as
+    quantidades de sync_week().
+    """
+    extras_data = extras_data or {}
+    back_charges = back_charges or {}
+    start = pd.Timestamp(start).strftime('%Y-%m-%d')
+    end = pd.Timestamp(end).strftime('%Y-%m-%d')
+
+    weeks = prepare_weeks(workbook_df, start, end)
+    result = {"start": start, "end": end, "jobs": int(len(weeks)), "weeks": [], "rows_saved": 0}
+    if weeks.empty:
+        return result
+
+    jobs, payouts = compute_weekly_payouts(weeks, TEAM_DISCOUNTS, extras_data, back_charges)
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs_by_week_installer = jobs.groupby(["pay_week", "installer"], sort=False)
+    for period, week_payouts in payouts.groupby(level="pay_week", sort=False):
+        week_result = {
+            "pay_date": period, "jobs": int(week_payouts["jobs"].sum()), "installers": [], "files": [],
+        }
+        report_rows = []
+        for (_, installer), payout in week_payouts.iterrows():
+            report = build_installer_report(
+                installer, jobs_by_week_installer.get_group((period, installer)), payout["final_total"], period,
+                extras_data.get((period, installer), []), back_charges.get((period, installer), 0.0),
+            )
+            path = os.path.join(output_dir, report_file_name(installer, period))
+            with open(path, "wb") as f:
+                f.write(render_report(report))
+            week_result["files"].append(path)
+
+            lucro = compute_lucro(payout["total_labor"], payout["final_total"], installer == "PM0")
+            report_rows.append([installer, payout["total_labor"], payout["final_total"], lucro])
+            week_result["installers"].append({
+                "installer": installer,
+                "jobs": int(payout["jobs"]),
+                "labor": round(float(payout["total_labor"]), 2),
+                "final_total": round(float(payout["final_total"]), 2),
+                "lucro": round(float(lucro), 2),
+            })
+
+        total_labor = sum(row[1] for row in report_rows)
+        total_after = sum(row[2] for row in report_rows)
+        total_lucro = sum(row[3] for row in report_rows)
+        path = os.path.join(output_dir, f"Relatorio_Semanal_{period}.pdf")
+        with open(path, "wb") as f:
+            f.write(render_consolidated_report(report_rows, total_labor, total_after, total_lucro))
+        week_result["files"].append(path)
+        week_result["totals"] = {
+            "labor": round(float(total_labor), 2),
+            "total_after": round(float(total_after), 2),
+            "lucro": round(float(total_lucro), 2),
+        }
+        result["weeks"].append(week_result)
+
+    if save:
+        rows = week_database_frame(jobs)
+        extras, charges = adjustment_rows(extras_data, back_charges)
+        diff = sync_week(rows, extras=extras, back_charges=charges)
+        result["rows_saved"] = diff["inserted"] + diff["updated"]
+        result["sync"] = {key: value for key, value in diff.items() if key != "changes"}
+        archive_week(rows)
+    return result
+
+
+# Função para executar o fechamento de uma semana sem interface
+def close_week(workbook_df, pay_date, output_dir, save=True, extras_data=None, back_charges=None):
+    """
+    Calcula os pagamentos da semana, grava um PDF por instalador e o
+    relatório consolidado em output_dir e, se save=True, sincroniza a semana
+    com o banco em uma única transação. extras_data e back_charges são
+    chaveados só pelo instalador.
+
+    Retorna um dicionário serializável em JSON com o resumo do fechamento.
+    """
+    period = pd.Timestamp(pay_date).strftime('%Y-%m-%d')
+    batch = close_weeks(
+        workbook_df, period, period, output_dir, save,
+        {(period, installer): extras for installer, extras in (extras_data or {}).items()},
+        {(period, installer): value for installer, value in (back_charges or {}).items()},
+    )
+    if not batch["weeks"]:
+        return {"pay_date": period, "jobs": 0, "installers": [], "files": [], "rows_saved": 0}
+    result = batch["weeks"][0]
+    result["rows_saved"] = batch["rows_saved"]
+    if "sync" in batch:
+        result["sync"] = batch["sync"]
+    return result
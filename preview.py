@@ -0,0 +1,41 @@
+import pandas as pd
+
+
+# Tamanhos de página oferecidos nas pré-visualizações
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+# Função para filtrar as linhas por instalador e intervalo de pay date
+def filter_rows(df, installers=None, start=None, end=None, installer_column="installer", date_column="pay date"):
+    """
+    Aplica os filtros no servidor com uma única máscara booleana; colunas
+    ausentes são ignoradas. Não copia o DataFrame quando nada é filtrado.
+    """
+    mask = None
+    if installers and installer_column in df.columns:
+        mask = df[installer_column].astype(str).isin([str(installer) for installer in installers])
+    if (start is not None or end is not None) and date_column in df.columns:
+        dates = pd.to_datetime(df[date_column], errors="coerce")
+        date_mask = dates.notna()
+        if start is not None:
+            date_mask &= dates >= pd.Timestamp(start)
+        if end is not None:
+            date_mask &= dates <= pd.Timestamp(end)
+        mask = date_mask if mask is None else mask & date_mask
+    return df if mask is None else df[mask]
+
+
+# Função para ordenar e recortar uma página de linhas
+def page_rows(df, page, page_size, sort_by=None, ascending=True):
+    """
+    Ordena (estável, vazios por último) e devolve só as linhas da página
+    pedida, contada a partir de 1. A página é limitada ao intervalo válido.
+    Retorna (linhas da página, total de linhas, total de páginas, página).
+    """
+    total = len(df)
+    pages = max((total + page_size - 1) // page_size, 1)
+    page = min(max(int(page), 1), pages)
+    if sort_by is not None and sort_by in df.columns:
+        df = df.sort_values(sort_by, ascending=ascending, kind="stable", na_position="last")
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size], total, pages, page
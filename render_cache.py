@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from disk_budget import DiskBudget
+
+
+# Limites do cache de PDFs renderizados (memória do processo + disco compartilhado)
+RENDER_CACHE_DIR = os.path.join(".cache", "reports")
+MAX_MEMORY_BYTES = 64 * 1024 * 1024
+MAX_DISK_BYTES = 512 * 1024 * 1024
+DISK_TRIM_TARGET = int(MAX_DISK_BYTES * 0.8)
+
+_memory = OrderedDict()
+_memory_bytes = 0
+_lock = threading.Lock()
+
+_disk = DiskBudget(RENDER_CACHE_DIR, MAX_DISK_BYTES, DISK_TRIM_TARGET)
+
+
+# Função para gerar a chave canônica de um conjunto de entradas
+def render_key(kind, template_version, inputs):
+    """
+    SHA-256 do JSON canônico (chaves ordenadas) de kind, versão do modelo e
+    entradas. Datas e outros tipos não-JSON entram pelo seu str().
+    """
+    canonical = json.dumps(
+        {"kind": kind, "template": template_version, "inputs": inputs},
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _disk_path(key):
+    return os.path.join(RENDER_CACHE_DIR, key[:2], f"{key}.pdf")
+
+
+def _remember(key, content):
+    global _memory_bytes
+    if key in _memory:
+        _memory.move_to_end(key)
+        return
+    _memory[key] = content
+    _memory_bytes += len(content)
+    while _memory and _memory_bytes > MAX_MEMORY_BYTES:
+        _, evicted = _memory.popitem(last=False)
+        _memory_bytes -= len(evicted)
+
+
+# Função para buscar um PDF já renderizado
+def get_rendered(key):
+    with _lock:
+        content = _memory.get(key)
+        if content is not None:
+            _memory.move_to_end(key)
+            return content
+
+    try:
+        with open(_disk_path(key), "rb") as f:
+            content = f.read()
+    except OSError:
+        return None
+
+    with _lock:
+        _remember(key, content)
+    return content
+
+
+# Função para guardar um PDF renderizado (memória e disco)
+def put_rendered(key, content):
+    with _lock:
+        _remember(key, content)
+
+    path = _disk_path(key)
+    if os.path.exists(path):
+        return
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        _disk.add(len(content))
+    except OSError:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+# Função para renderizar com cache
+def cached_render(key, render):
+    """
+    Devolve os bytes guardados para key ou chama render() e guarda o
+    resultado. Falhas de disco nunca impedem a renderização.
+    """
+    content = get_rendered(key)
+    if content is None:
+        content = render()
+        put_rendered(key, content)
+    return content
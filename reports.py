@@ -0,0 +1,449 @@
+import io
+import os
+import re
+import json
+import base64
+import zipfile
+import multiprocessing
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from fpdf import FPDF
+
+from render_cache import cached_render, get_rendered, put_rendered, render_key
+
+
+# Incrementar sempre que o layout dos PDFs mudar (invalida o cache de renderização)
+TEMPLATE_VERSION = 1
+
+# Dados estruturados embutidos nos PDFs gerados (campo Keywords dos metadados)
+PAYLOAD_VERSION = 1
+PAYLOAD_PREFIX = "PMHRS-PAYLOAD/"
+_PAYLOAD_RE = re.compile(rb"/Keywords \(" + re.escape(PAYLOAD_PREFIX.encode()) + rb"(\d+) ([A-Za-z0-9+/=]+)\)")
+
+
+# Classe PDF para relatórios
+class CustomStyledPDF(FPDF):
+    def __init__(self, orientation="L", unit="mm", format="A4"):
+        super().__init__(orientation, unit="mm", format="A4")
+        self.set_auto_page_break(auto=True, margin=15)
+
+    def header(self):
+        self.set_fill_color(200, 220, 255)
+        self.set_font("Arial", "B", 14)
+        self.cell(0, 10, "PM Home Remodeling System", ln=True, align="C", fill=True)
+        self.set_font("Arial", "B", 12)
+        self.cell(0, 10, f"Week - {self.period}", ln=True, align="C")
+        self.ln(10)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font("Arial", "I", 8)
+        self.cell(0, 10, f"Installer: {self.team_name}", align="C")
+
+    def set_team_and_period(self, team_name, period):
+        self.team_name = team_name
+        self.period = period
+
+    def add_table(self, title, headers, rows):
+        self.set_font("Arial", "B", 10)
+        self.cell(0, 10, title, ln=True, align="L")
+        self.ln(5)
+
+        self.set_fill_color(180, 180, 180)
+        self.set_text_color(255, 255, 255)
+        self.set_font("Arial", "B", 8)
+        col_widths = [25, 50, 30, 30, 40, 40, 30]
+        for header, width in zip(headers, col_widths):
+            self.cell(width, 8, header, border=1, align="C", fill=True)
+        self.ln()
+
+        self.set_font("Arial", "", 8)
+        self.set_text_color(0, 0, 0)
+        for row in rows:
+            for cell, width in zip(row, col_widths):
+                self.cell(width, 8, str(cell), border=1, align="C")
+            self.ln()
+
+    def add_long_table(self, title, headers, rows):
+        """
+        Como add_table, mas lê rows sob demanda (pode ser um gerador) e repete
+        o cabeçalho no topo de cada página nova. Retorna o número de linhas.
+        """
+        col_widths = [25, 50, 30, 30, 40, 40, 30]
+
+        def table_header():
+            self.set_fill_color(180, 180, 180)
+            self.set_text_color(255, 255, 255)
+            self.set_font("Arial", "B", 8)
+            for header, width in zip(headers, col_widths):
+                self.cell(width, 8, header, border=1, align="C", fill=True)
+            self.ln()
+            self.set_font("Arial", "", 8)
+            self.set_text_color(0, 0, 0)
+
+        self.set_font("Arial", "B", 10)
+        self.cell(0, 10, title, ln=True, align="L")
+        self.ln(5)
+        table_header()
+
+        written = 0
+        for row in rows:
+            if self.get_y() + 8 > self.page_break_trigger:
+                self.add_page()
+                table_header()
+            for cell, width in zip(row, col_widths):
+                self.cell(width, 8, str(cell), border=1, align="C")
+            self.ln()
+            written += 1
+        return written
+
+
+# Função para gerar o PDF detalhado
+def generate_detailed_pdf(data, summary, team_name, period, extras, back_charge):
+    pdf = CustomStyledPDF()
+    pdf.set_team_and_period(team_name, period)
+    pdf.add_page()
+
+    summary_headers = [
+        "ID", "Name", "Address", "City", "State",
+        "Phone Number", "TOTAL after %"
+    ]
+    summary_rows = [
+        [
+            row["ID"], row["Name"], row["Address"], row["City"],
+            row["State"], row["Phone Number"], f"${row['TOTAL after %']:.2f}"
+        ]
+        for row in summary
+    ]
+    pdf.add_table("Summary", summary_headers, summary_rows)
+    pdf.set_keywords(encode_report_payload(
+        build_report_payload(data, summary, team_name, period, extras, back_charge)
+    ))
+
+    detail_headers = [
+        "Installer", "Customer Name", "Job Number", "Labor",
+        "When the job was done", "Prices after %", "Despesas"
+    ]
+    detail_rows = [
+        [
+            row["installer"], row["customer name"], row["job number"],
+            f"${row['labor']:.2f}", row["when the job was done"],
+            f"${row['prices after %']:.2f}", f"${row['despesas']:.2f}"
+        ]
+        for row in data
+    ]
+    pdf.add_table("Details", detail_headers, detail_rows)
+
+    # Exibir Extras e Back Charge
+    if extras or back_charge > 0:
+        pdf.ln(10)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, "Extras e Back Charges", ln=True, align="L")
+        pdf.set_font("Arial", "", 10)
+
+        # Listar extras, se existirem
+        for extra in extras:
+            pdf.cell(
+                0,
+                10,
+                f"Extra: {extra['name']} - ${extra['value']:.2f} on {extra['date']}",
+                ln=True,
+                align="L",
+            )
+
+        # Exibir Back Charge, se aplicado
+        if back_charge > 0:
+            pdf.cell(
+                0,
+                10,
+                f"Back Charge aplicado: -${back_charge:.2f}",
+                ln=True,
+                align="L",
+            )
+
+    return pdf.output(dest="S").encode("latin1")
+
+
+class PDFReport(FPDF):
+    def header(self):
+        self.set_font("Arial", "B", 12)
+        title = f"Relatório da Semana - {datetime.now().strftime('%d/%m/%Y')}"
+        self.cell(0, 10, title, align="C", ln=True)
+        self.ln(10)
+
+    def add_table(self, headers, rows):
+        """
+        Adiciona uma tabela ao PDF.
+        """
+        self.set_font("Arial", "B", 10)
+        col_widths = [40, 40, 40, 40]  # Ajuste os tamanhos das colunas conforme necessário
+        for header, width in zip(headers, col_widths):
+            self.cell(width, 10, header, border=1, align="C")
+        self.ln()
+
+        self.set_font("Arial", "", 10)
+        for row in rows:
+            for value, width in zip(row, col_widths):
+                self.cell(width, 10, str(value), border=1, align="C")
+            self.ln()
+
+    def add_totals(self, totals):
+        """
+        Adiciona a tabela de totais ao PDF.
+        """
+        self.ln(10)
+        self.set_font("Arial", "B", 10)
+        self.cell(0, 10, "Totais Gerais", align="C", ln=True)
+        self.ln(5)
+
+        col_widths = [60, 60]
+        self.set_font("Arial", "B", 10)
+        for header, width in zip(["Categoria", "Total"], col_widths):
+            self.cell(width, 10, header, border=1, align="C")
+        self.ln()
+
+        self.set_font("Arial", "", 10)
+        for row in totals:
+            for value, width in zip(row, col_widths):
+                self.cell(width, 10, str(value), border=1, align="C")
+            self.ln()
+
+
+# Função para montar os argumentos do relatório de um instalador
+def build_installer_report(installer, installer_jobs, final_total, period, extras, back_charge):
+    """
+    Reúne tudo o que generate_detailed_pdf() precisa para um instalador,
+    sem renderizar nada. installer_jobs é o DataFrame de serviços já com
+    'prices after %'. Retorna um dicionário de argumentos nomeados.
+    """
+    summary = [{
+        "ID": installer,
+        "Name": f"Installer {installer}",
+        "Address": "Sample Address",
+        "City": "Sample City",
+        "State": "ST",
+        "Phone Number": "(000) 000-0000",
+        "TOTAL after %": float(final_total)
+    }]
+    return {
+        "data": installer_jobs.to_dict(orient="records"),
+        "summary": summary,
+        "team_name": f"Installer {installer}",
+        "period": period,
+        "extras": extras,
+        "back_charge": back_charge,
+    }
+
+
+def report_file_name(installer, period):
+    return f"{installer}_Report_{period}.pdf"
+
+
+def _report_key(report):
+    return render_key("installer_report", TEMPLATE_VERSION, report)
+
+
+# Função para renderizar um relatório a partir dos argumentos (com cache)
+def render_report(report):
+    return cached_render(_report_key(report), lambda: generate_detailed_pdf(**report))
+
+
+# Função para renderizar vários relatórios em paralelo e juntar em um ZIP
+def render_reports_zip(reports, max_workers=None, on_progress=None):
+    """
+    reports é {nome_do_arquivo: argumentos de build_installer_report()}.
+    Relatórios já renderizados saem do cache; os demais são renderizados em
+    um pool de processos e gravados no ZIP à medida que ficam prontos.
+    on_progress(prontos, total) é chamado a cada relatório gravado no ZIP.
+    Retorna os bytes do ZIP.
+    """
+    total = len(reports)
+    done = 0
+
+    def written():
+        nonlocal done
+        done += 1
+        if on_progress:
+            on_progress(done, total)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        pending = {}
+        for file_name, report in reports.items():
+            key = _report_key(report)
+            content = get_rendered(key)
+            if content is None:
+                pending[file_name] = (key, report)
+            else:
+                archive.writestr(file_name, content)
+                written()
+
+        workers = max_workers or max(1, min(os.cpu_count() or 1, len(pending)))
+        if workers == 1 or len(pending) <= 1:
+            for file_name, (key, report) in pending.items():
+                content = generate_detailed_pdf(**report)
+                put_rendered(key, content)
+                archive.writestr(file_name, content)
+                written()
+        else:
+            # "spawn" evita fork de um processo com várias threads (servidor Streamlit)
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = {
+                    pool.submit(generate_detailed_pdf, **report): (file_name, key)
+                    for file_name, (key, report) in pending.items()
+                }
+                for future in as_completed(futures):
+                    file_name, key = futures[future]
+                    content = future.result()
+                    put_rendered(key, content)
+                    archive.writestr(file_name, content)
+                    written()
+    return buffer.getvalue()
+
+
+# Função para gerar o PDF consolidado da semana (com cache)
+def render_consolidated_report(report_rows, total_labor, total_after, total_lucro):
+    """
+    Monta o PDFReport com a tabela por instalador e os totais gerais.
+    O título usa a data de hoje, que por isso também faz parte da chave.
+    """
+    inputs = {
+        "date": datetime.now().strftime('%d/%m/%Y'),
+        "rows": report_rows,
+        "totals": [total_labor, total_after, total_lucro],
+    }
+
+    def render():
+        pdf = PDFReport()
+        pdf.add_page()
+
+        # Adicionar a tabela detalhada
+        pdf.add_table(["Installer", "Labor", "TOTAL after %", "Lucro"], report_rows)
+
+        # Adicionar os totais gerais
+        pdf.add_totals([["Labor", f"${total_labor:,.2f}"],
+                        ["TOTAL after %", f"${total_after:,.2f}"],
+                        ["Lucro", f"${total_lucro:,.2f}"]])
+
+        return pdf.output(dest="S").encode("latin1")
+
+    return cached_render(render_key("consolidated_report", TEMPLATE_VERSION, inputs), render)
+
+
+# Função para montar os dados estruturados de um relatório de instalador
+def build_report_payload(data, summary, team_name, period, extras, back_charge):
+    """
+    Monta o dicionário versionado com os mesmos números impressos no PDF:
+    instalador, semana de pagamento, valores por serviço, extras, back charge
+    e total final.
+    """
+    installer = summary[0]["ID"] if summary else team_name
+    return {
+        "version": PAYLOAD_VERSION,
+        "installer": str(installer),
+        "team_name": team_name,
+        "pay_week": str(period),
+        "jobs": [
+            {
+                "customer_name": str(row["customer name"]),
+                "job_number": str(row["job number"]),
+                "labor": float(row["labor"]),
+                "despesas": float(row["despesas"]),
+                "prices_after_percent": float(row["prices after %"]),
+            }
+            for row in data
+        ],
+        "extras": [
+            {"name": extra["name"], "value": float(extra["value"]), "date": str(extra["date"])}
+            for extra in extras
+        ],
+        "back_charge": float(back_charge),
+        "final_total": float(sum(row["TOTAL after %"] for row in summary)),
+    }
+
+
+def encode_report_payload(payload):
+    encoded = base64.b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    return f"{PAYLOAD_PREFIX}{payload['version']} {encoded.decode('ascii')}"
+
+
+# Função para ler os dados estruturados de um PDF gerado pelo sistema
+def read_report_payload(pdf_data):
+    """
+    Procura nos bytes do PDF os dados embutidos por generate_detailed_pdf(),
+    sem análise de layout. Retorna o dicionário ou None para PDFs de fora
+    ou antigos (ou de uma versão de payload desconhecida).
+    """
+    match = _PAYLOAD_RE.search(pdf_data)
+    if match is None or int(match.group(1)) != PAYLOAD_VERSION:
+        return None
+    try:
+        return json.loads(base64.b64decode(match.group(2)).decode("utf-8"))
+    except ValueError:
+        return None
+
+
+# Função para gerar o PDF do Labor Bill a partir das consultas do banco
+def generate_labor_bill_pdf(office, start, end, totals, jobs, adjustments):
+    """
+    totals são as linhas de query_labor_bill_totals() (dicionários), jobs
+    as tuplas de iter_labor_bill_jobs() já ordenadas por instalador (lidas
+    sob demanda) e adjustments as linhas de query_labor_bill_adjustments().
+    Cada instalador ganha sua tabela de serviços, com o cabeçalho repetido
+    nas páginas seguintes.
+    """
+    installers = [row["Installer"] for row in totals]
+    pdf = CustomStyledPDF()
+    pdf.set_team_and_period(", ".join(installers) if len(installers) <= 6 else "Todos", f"{start} a {end}")
+    pdf.add_page()
+
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 10, f"{office or 'Todos os escritórios'} - Labor Bill", ln=True, align="L")
+
+    pdf.add_table(
+        "Summary",
+        ["Installer", "Jobs", "Labor", "Despesas", "TOTAL after %", "Extras - Back Ch.", "Total Due"],
+        [
+            [
+                row["Installer"], int(row["Jobs"]), f"${row['Total_labor']:,.2f}",
+                f"${row['Total_expenses']:,.2f}", f"${row['Total_after']:,.2f}",
+                f"${row['Total_extras'] - row['Total_back_charges']:,.2f}", f"${row['Total_due']:,.2f}",
+            ]
+            for row in totals
+        ] + [[
+            "TOTAL", sum(int(row["Jobs"]) for row in totals),
+            f"${sum(row['Total_labor'] for row in totals):,.2f}",
+            f"${sum(row['Total_expenses'] for row in totals):,.2f}",
+            f"${sum(row['Total_after'] for row in totals):,.2f}",
+            f"${sum(row['Total_extras'] - row['Total_back_charges'] for row in totals):,.2f}",
+            f"${sum(row['Total_due'] for row in totals):,.2f}",
+        ]],
+    )
+
+    # Colunas de jobs: Installer, Pay_date, Job_date, Customer_name, Job_number, Labor, Expenses, after %, BC
+    for installer, rows in groupby(jobs, key=lambda row: row[0]):
+        pdf.ln(5)
+        pdf.add_long_table(
+            f"Installer {installer}",
+            ["Pay Date", "Customer Name", "Job Number", "Job Date", "Labor", "Prices after %", "Despesas"],
+            (
+                [row[1], row[3], row[4], row[2], f"${row[5]:.2f}", f"${row[7]:.2f}", f"${row[6]:.2f}"]
+                for row in rows
+            ),
+        )
+
+    if adjustments:
+        pdf.ln(5)
+        pdf.add_long_table(
+            "Extras e Back Charges",
+            ["Installer", "Description", "Pay Date", "Kind", "Value"],
+            (
+                [row["Installer"], row["Description"], row["Pay_date"], row["Kind"], f"${row['Value']:,.2f}"]
+                for row in adjustments
+            ),
+        )
+
+    return pdf.output(dest="S").encode("latin1")
@@ -0,0 +1,215 @@
+import io
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from disk_budget import DiskBudget
+
+
+# Limites do cache de planilhas (compartilhado entre sessões do processo)
+MAX_CACHED_WORKBOOKS = 16
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Colunas realmente usadas pelo sistema (nome normalizado -> tipo)
+PROJECTED_COLUMNS = {
+    "installer": "text",
+    "pay date": "datetime",
+    "data de pagamento": "datetime",
+    "labor": "float",
+    "despesas": "float",
+    "expenses": "float",
+    "customer name": "text",
+    "job number": "text",
+    "date": "datetime",
+}
+COLUMN_RENAMES = {
+    "unnamed: 8": "customer name",
+    "job #": "job number",
+}
+
+# Cópias colunares (Parquet) das planilhas já lidas, por conteúdo
+# (incrementar SIDECAR_VERSION sempre que PROJECTED_COLUMNS ou os tipos mudarem)
+# Cada versão de planilha enviada gera uma cópia; as menos usadas saem quando
+# o total passa de MAX_SIDECAR_BYTES (até sobrar SIDECAR_TRIM_TARGET)
+SIDECAR_DIR = os.path.join(".cache", "workbooks")
+SIDECAR_VERSION = 2
+MAX_SIDECAR_BYTES = 256 * 1024 * 1024
+SIDECAR_TRIM_TARGET = int(MAX_SIDECAR_BYTES * 0.8)
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+# Cópias de outras versões são apagadas sempre que a pasta é percorrida
+_sidecars = DiskBudget(
+    SIDECAR_DIR, MAX_SIDECAR_BYTES, SIDECAR_TRIM_TARGET,
+    is_stale=lambda name: name.endswith(".parquet") and not name.endswith(f".v{SIDECAR_VERSION}.parquet"),
+)
+
+
+# Função para calcular a chave de conteúdo de um arquivo enviado
+def workbook_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Função para normalizar as colunas da planilha de pagamentos
+def normalize_columns(df):
+    """
+    Padroniza os nomes das colunas (minúsculas, sem espaços nas pontas),
+    renomeia as colunas conhecidas e remove linhas sem cliente.
+    """
+    df.columns = [str(col).strip().lower() for col in df.columns]
+    df = df.rename(columns=COLUMN_RENAMES)
+    if "customer name" in df.columns:
+        df = df.dropna(subset=["customer name"])
+    return df
+
+
+def _parse_workbook(data):
+    df = pd.read_excel(io.BytesIO(data), header=1)
+    return normalize_columns(df)
+
+
+def _to_text(value):
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return str(int(value))
+    return str(value).strip() if isinstance(value, str) else str(value)
+
+
+def _typed_column(values, kind):
+    if kind == "float":
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").astype("float64")
+    if kind == "datetime":
+        return pd.to_datetime(pd.Series(values, dtype=object), errors="coerce")
+    return pd.Series([_to_text(value) for value in values], dtype=object)
+
+
+# Função para ler só as colunas usadas, em modo streaming do openpyxl
+def _parse_projected(data):
+    """
+    Lê a primeira aba com openpyxl em modo read_only (linha a linha, sem
+    montar a planilha inteira na memória), usando a linha 2 como cabeçalho,
+    e guarda apenas as colunas de PROJECTED_COLUMNS, já com tipos definidos.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        next(rows, None)
+        header = next(rows, None) or ()
+
+        positions = {}
+        for idx, cell in enumerate(header):
+            name = f"unnamed: {idx}" if cell is None else str(cell).strip().lower()
+            name = COLUMN_RENAMES.get(name, name)
+            if name in PROJECTED_COLUMNS and name not in positions:
+                positions[name] = idx
+
+        values = {name: [] for name in positions}
+        for row in rows:
+            for name, idx in positions.items():
+                values[name].append(row[idx] if idx < len(row) else None)
+    finally:
+        workbook.close()
+
+    df = pd.DataFrame({
+        name: _typed_column(values[name], PROJECTED_COLUMNS[name]) for name in positions
+    })
+    if "customer name" in df.columns:
+        df = df.dropna(subset=["customer name"]).reset_index(drop=True)
+    return df
+
+
+def _sidecar_path(key):
+    return os.path.join(SIDECAR_DIR, f"{key}.v{SIDECAR_VERSION}.parquet")
+
+
+# Função para ler a planilha projetada usando a cópia Parquet quando existir
+def _load_projected(key, data):
+    path = _sidecar_path(key)
+    if os.path.exists(path):
+        try:
+            df = pd.read_parquet(path)
+            # mtime marca o último uso (as menos usadas saem primeiro)
+            os.utime(path, None)
+            return df
+        except Exception:
+            pass
+
+    df = _parse_projected(data)
+    tmp_path = None
+    try:
+        os.makedirs(SIDECAR_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=SIDECAR_DIR, suffix=".tmp")
+        os.close(fd)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        _sidecars.add(os.path.getsize(path))
+    except Exception:
+        # Cópia que não chegou ao nome final não fica esquecida na pasta
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    return df
+
+
+def _evict():
+    global _cache_bytes
+    while _cache and (len(_cache) > MAX_CACHED_WORKBOOKS or _cache_bytes > MAX_CACHE_BYTES):
+        _, (_, size) = _cache.popitem(last=False)
+        _cache_bytes -= size
+
+
+# Função para ler a planilha de pagamentos com cache por conteúdo
+def read_payroll_workbook(data, projected=True):
+    """
+    Lê a planilha (header=1) e normaliza as colunas uma única vez por conteúdo.
+    O resultado fica em um cache LRU limitado por quantidade e por memória,
+    chaveado pelo SHA-256 dos bytes enviados.
+
+    Com projected=True (padrão) só as colunas de PROJECTED_COLUMNS são lidas,
+    com tipos explícitos, e uma cópia Parquet fica em SIDECAR_DIR para que as
+    próximas aberturas do mesmo arquivo não passem pelo openpyxl. Com
+    projected=False a planilha inteira é lida com pd.read_excel.
+
+    O DataFrame em cache nunca sai do módulo: cada chamada recebe uma cópia,
+    que pode ser editada sem afetar as próximas leituras.
+    """
+    global _cache_bytes
+    digest = workbook_digest(data)
+    key = (digest, projected)
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            return entry[0].copy()
+
+    df = _load_projected(digest, data) if projected else _parse_workbook(data)
+    size = int(df.memory_usage(deep=True).sum())
+
+    with _cache_lock:
+        if key not in _cache:
+            _cache[key] = (df, size)
+            _cache_bytes += size
+            _evict()
+    return df.copy()
+
+
+# Função para limpar o cache de planilhas
+def clear_workbook_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0